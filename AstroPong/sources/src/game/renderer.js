@@ -109,13 +109,24 @@ class InputHandler {
             sender: 'front'
         };
     }
+    #lastQueuedIndex(player) {
+        for (let i = this.#messageQueue.length - 1; i >= 0; i--) {
+            if (this.#messageQueue[i].player === player) {
+                return i;
+            }
+        }
+        return -1;
+    }
     sendActiveInputs() {
         if (!this.#active) return;
         for (const settings of this.#inputMap.values()) {
             if (settings.justMod && this.#checkInputValues(settings)) {
                 const message = this.#prepareMessage(settings.player);
-                if (this.#messageQueue.length >= this.#queueSize) {
-                    this.#messageQueue[this.#queueSize - 1] = message;
+                // binary inputs only carry their own player's value: when the queue is full,
+                // replace the newest message of the same player so the other player's change is kept
+                const index = this.#lastQueuedIndex(settings.player);
+                if (this.#messageQueue.length >= this.#queueSize && index !== -1) {
+                    this.#messageQueue[index] = message;
                 }
                 else {
                     this.#messageQueue.push(message);
@@ -761,6 +772,9 @@ function waitForSocketConnection(socket) {
     });
 }
 
+// signed ticket returned by matchmaking, lets the game server accept the connection without calling it back
+let gameTicket = null;
+
 export async function initWebSocket(mode, option, names) {
     let uid;
     if (mode === 'PVP' && option === 1) {
@@ -772,19 +786,40 @@ export async function initWebSocket(mode, option, names) {
         uid = await createUID(mode, option);
     }
 
+    await openGameSocket(uid, names, false);
+}
+
+async function openGameSocket(uid, names, resume, rejoined = false) {
     let authorization = getCookie('jwt_token') ? getCookie('jwt_token') : getCookie('guest_token');
 
     const clear_token = authorization.replace('Bearer ', '').trim();
+    const params = [];
+    if (gameTicket) {
+        params.push(`ticket=${encodeURIComponent(gameTicket)}`);
+    }
+    if (resume) {
+        params.push('resume=1');
+    }
     try {
         socket = new WebSocket(
-            `wss://${window.location.hostname}:7777/ws/pong/${uid}/`,
+            `wss://${window.location.hostname}:7777/ws/pong/${uid}/` + (params.length ? `?${params.join('&')}` : ''),
             [`token_${clear_token}`]
         );
         await waitForSocketConnection(socket);
         socket.send(JSON.stringify({ type: "greetings", sender: "front", name: names }));
 
         socket.onmessage = function (event) {
-            gameData = JSON.parse(event.data);
+            const message = JSON.parse(event.data);
+
+            // the game moved to another game server: reconnect to its new uid and pick up where it was
+            if (message.type === "redirect") {
+                socket.onclose = null;
+                gameTicket = message.ticket || null;
+                openGameSocket(message.uid, names, true);
+                return;
+            }
+
+            gameData = message;
 
             if (gameData.type === "opponent_connected" || gameData.type === "timeout") {
                 matchmakingStatus = gameData.type;
@@ -797,6 +832,11 @@ export async function initWebSocket(mode, option, names) {
         };
 
         socket.onclose = function (event) {
+            // connection dropped mid-game: the server keeps the game for a few seconds, rejoin it once
+            if (isGameOver !== true && event.code === 1006 && !rejoined) {
+                openGameSocket(uid, names, true, true).catch(() => resetGame());
+                return;
+            }
             if (isGameOver !== true) {
                 resetGame();
             }
@@ -826,6 +866,7 @@ async function joinUID(mode, option) {
         let data = await joinResponse.json();
 
         let gameUID = data.uid;
+        gameTicket = data.ticket || null;
 
         if (joinResponse.status !== 200 && joinResponse.status !== 404) {
             throw new Error(data.error)
@@ -857,6 +898,7 @@ async function createUID(mode, option) {
         let data = await joinResponse.json();
 
         let gameUID = data.uid;
+        gameTicket = data.ticket || null;
 
         if (joinResponse.status !== 200) {
             throw new Error(data.error)
@@ -901,11 +943,29 @@ function setTexture(path, repeat = 1) {
     return texture;
 }
 
+let inputSequence = 0;
+
+// keyDown messages are sent as 4 bytes (player, direction, sequence) that the server decodes without JSON
+function encodeInput(message) {
+    const player = message.player === 'p1' ? 1 : 2;
+    const view = new DataView(new ArrayBuffer(4));
+    view.setUint8(0, player);
+    view.setInt8(1, message.value[player - 1]);
+    view.setUint16(2, inputSequence, true);
+    inputSequence = (inputSequence + 1) & 0xFFFF;
+    return view.buffer;
+}
+
 export function sendMessage(message) {
     // add "sender" field to message with value "front"
     message["sender"] = "front"
     if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(JSON.stringify(message));
+        if (message.type === 'keyDown') {
+            socket.send(encodeInput(message));
+        }
+        else {
+            socket.send(JSON.stringify(message));
+        }
     }
 }
 
@@ -1579,6 +1639,12 @@ function updateGame() {
             return;
         }
 
+        if (!gameData.ball) {
+            // other control messages (opponent_disconnected, opponent_reconnected...) carry no state
+            gameData = null;
+            return;
+        }
+
 
         if (gameData.ball.lastTouch === "1" && !p1Touched && gameData.goal === 'None') {
             increasePlayer1Light = true;
@@ -7,10 +7,13 @@ import ssl
 import requests
 from enum import Enum
 import termios
+import os
 from typing import Optional
 import urllib3
 import curses
 from CLIGame import CLIGame
+from binary_frame import BINARY_SUBPROTOCOL, decode_state, encode_input
+from delta_frame import DELTA_SUBPROTOCOL, DeltaDecoder
 import logging
 import signal
 import atexit
@@ -50,6 +53,12 @@ class CLIClient:
         self.game = None
         self.running = True
         self.service_token = None
+        # ticket signe renvoye par le matchmaking, presente au serveur de jeu a la connexion
+        self.game_ticket = None
+        # redirection recue du serveur (partie deplacee) et reconnexion en cours
+        self.redirect = None
+        self.resuming = False
+        self.game_uid = None
         self.clear_token = None
         self.game_state = None
         self.server_address = None
@@ -57,6 +66,10 @@ class CLIClient:
         
         self.goal_event = asyncio.Event()
         self.goal_timer = None
+
+        # format des etats de jeu demande au serveur : binary (defaut), delta ou json
+        self.state_format = os.getenv('PONG_STATE_FORMAT', 'binary')
+        self.delta_decoder = DeltaDecoder()
         
         self.ssl_context = ssl.create_default_context()
         self.ssl_context.check_hostname = False
@@ -171,6 +184,7 @@ class CLIClient:
             )
             
             if response.status_code == 200:
+                self.game_ticket = response.json().get("ticket")
                 return response.json()["uid"]
             if response.status_code == 404:
                 return "error"
@@ -191,6 +205,7 @@ class CLIClient:
             )
             
             if response.status_code == 200:
+                self.game_ticket = response.json().get("ticket")
                 return response.json()["uid"]
             return None
                 
@@ -283,6 +298,7 @@ class CLIClient:
         # await websocket.send(json.dumps({"type": "start", "sender": "cli"}))
         
         last_direction = 0
+        input_sequence = 0
         keys_pressed = set()
         
         up_key = ord('w') if self.game.side == '1' else curses.KEY_UP
@@ -324,16 +340,20 @@ class CLIClient:
                             current_direction = -1
     
                 if current_direction != last_direction:
-                    message = {
-                        "type": "keyDown",
-                        'player': f'p{self.game.side}',
-                        'value': [current_direction, 0] if self.game.side == '1' else [0, current_direction],
-                        "sender": "cli"
-                    }
                     last_direction = current_direction
-                    
+
                     if self.game_state == GameState.IN_GAME.value:
-                        await websocket.send(json.dumps(message))
+                        if self.state_format == 'json':
+                            await websocket.send(json.dumps({
+                                "type": "keyDown",
+                                'player': f'p{self.game.side}',
+                                'value': [current_direction, 0] if self.game.side == '1' else [0, current_direction],
+                                "sender": "cli"
+                            }))
+                        else:
+                            # entree binaire de 4 octets, decodee sans JSON par le serveur
+                            await websocket.send(encode_input(current_direction, input_sequence))
+                            input_sequence += 1
                         # self.logger.debug(f"Player {self.game.side} sent direction: {current_direction}")
     
             except Exception as e:
@@ -375,7 +395,21 @@ class CLIClient:
             try:
                 # Recevoir et parser les données
                 message = await websocket.recv()
-                data = json.loads(message)
+                # etats de jeu en binaire, messages de controle en JSON
+                data = decode_state(message) if isinstance(message, bytes) else json.loads(message)
+                data = self.delta_decoder.decode(data)
+                if data is None:
+                    continue
+
+                if data.get('type') == 'redirect':
+                    # partie deplacee sur un autre serveur de jeu : connect_to_game s'y reconnecte
+                    self.redirect = data
+                    return
+
+                if self.resuming and data.get('type') in ('greetings', 'opponent_connected'):
+                    # reprise d'une partie deja lancee : pas d'ecran de depart
+                    self.game_state = GameState.IN_GAME.value
+                    continue
                 
                 if data.get('type') == 'opponent_connected' and data.get('opponent_connected'):
                     self.game.render_curses(self.window, self.game_state)
@@ -443,8 +477,12 @@ class CLIClient:
                 elif not self.goal_event.is_set():
                     self.game.render_curses(self.window, self.game_state)
     
-            except websockets.exceptions.ConnectionClosed:
+            except websockets.exceptions.ConnectionClosed as e:
                 # self.logger.debug(f"Error in handle_game_data, connection closed: {str(e)}")
+                if e.rcvd is None and not self.resuming:
+                    # coupure reseau : le serveur garde la partie quelques secondes, on la reprend
+                    self.redirect = {'uid': self.game_uid, 'ticket': self.game_ticket}
+                    return
                 self.window.clear()
                 self.window.box()
                 self.window.addstr(2, 2, "Connection lost handle game data, returning to menu...")
@@ -478,15 +516,33 @@ class CLIClient:
         except:
             pass
 
-    async def connect_to_game(self, game_uid: str, message: str):
+    def get_subprotocols(self):
+        subprotocols = [f'token_{self.clear_token}']
+        if self.state_format == 'binary':
+            subprotocols.append(BINARY_SUBPROTOCOL)
+        elif self.state_format == 'delta':
+            subprotocols.append(DELTA_SUBPROTOCOL)
+        return subprotocols
+
+    async def connect_to_game(self, game_uid: str, message: str, resume: bool = False):
         uri = f"wss://{self.server_address}/ws/pong/{game_uid}/"
+        params = []
+        if self.game_ticket:
+            params.append(f"ticket={self.game_ticket}")
+        if resume:
+            params.append("resume=1")
+        if params:
+            uri += "?" + "&".join(params)
+        self.resuming = resume
+        self.game_uid = game_uid
         
         try:
             async with websockets.connect(
                 uri, 
                 ssl=self.ssl_context,
-                subprotocols=[f'token_{self.clear_token}']
+                subprotocols=self.get_subprotocols()
             ) as websocket:
+                self.delta_decoder = DeltaDecoder()
                 await self.display_message(message, delay=0)
                 
                 await websocket.send(json.dumps({
@@ -516,7 +572,17 @@ class CLIClient:
                     
         finally:
             # self.logger.info("Exiting connect_to_game")
-            if not self.signal_received:
+            if not self.signal_received and self.redirect is None:
+                self.game.reset_game_objects()
+
+        redirect, self.redirect = self.redirect, None
+        if redirect is not None and not self.signal_received:
+            self.game_ticket = redirect.get('ticket')
+            try:
+                await self.connect_to_game(redirect['uid'], message, resume=True)
+            except Exception as e:
+                self.logger.error(f"Could not resume game {redirect['uid']}: {str(e)}")
+                self.running = False
                 self.game.reset_game_objects()
                 
 
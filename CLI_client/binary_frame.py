@@ -0,0 +1,104 @@
+import struct
+
+# Decodage des etats de jeu binaires (sous-protocole "pong.binary.v3" du serveur de jeu).
+# Le resultat a la meme forme que l'etat JSON, le reste du client n'a pas a changer.
+
+BINARY_SUBPROTOCOL = "pong.binary.v3"
+# premier octet de chaque etat : une autre version a une autre disposition
+BINARY_VERSION = 3
+
+BINARY_FRAME = struct.Struct("<BIffffffbfbfBBBBHHbbbbbH")
+
+WIDTH = 1500
+HEIGHT = 1000
+PADDLE_HEIGHT = HEIGHT // 6
+PADDLE1_X = (WIDTH // 30) / WIDTH
+PADDLE2_X = (WIDTH - WIDTH // 30) / WIDTH
+
+# Entree compacte envoyee au serveur a la place du JSON "keyDown"/"move" :
+# joueur (0 = cote du client), direction (1 monte, -1 descend, 0 stop), numero de sequence,
+# et eventuellement le tick vise
+INPUT_MESSAGE = struct.Struct("<BbH")
+INPUT_MESSAGE_TICK = struct.Struct("<BbHI")
+DIRECTIONS = {"up": 1, "down": -1}
+
+GAME_MODES = {0: None, 1: "PVP_keyboard", 2: "PVP_LAN", 3: "PVE"}
+
+FLAG_PLAYING = 1 << 0
+FLAG_PAUSE = 1 << 1
+FLAG_RESUME_ON_GOAL = 1 << 2
+FLAG_GAMEOVER = 1 << 3
+FLAG_GOAL_1 = 1 << 4
+FLAG_GOAL_2 = 1 << 5
+FLAG_WINNER_1 = 1 << 6
+FLAG_WINNER_2 = 1 << 7
+FLAG_SIDE_P1 = 1 << 8
+FLAG_SIDE_P2 = 1 << 9
+FLAG_WALL_TOP = 1 << 10
+FLAG_WALL_BOTTOM = 1 << 11
+FLAG_TOUCH_1 = 1 << 12
+FLAG_TOUCH_2 = 1 << 13
+FLAG_SEQUENCE_1 = 1 << 14
+FLAG_SEQUENCE_2 = 1 << 15
+
+
+def _pick(flags, first, second, first_value, second_value, default):
+    if flags & first:
+        return first_value
+    if flags & second:
+        return second_value
+    return default
+
+
+def decode_state(payload: bytes) -> dict:
+    (version, tick, ball_x, ball_y, speed, angle, paddle1_y, paddle2_y,
+     collision_side, collision_y, ai_side, ai_y,
+     score1, score2, score_limit, mode, sequence1, sequence2,
+     ball_bucket_x, ball_bucket_y, angle_tenths, paddle2_bucket, angle_halves, flags) = BINARY_FRAME.unpack(payload)
+    if version != BINARY_VERSION:
+        raise ValueError(f"unsupported binary state version: {version}")
+
+    raw_paddle2_y = paddle2_y * HEIGHT - PADDLE_HEIGHT / 2
+    return {
+        "type": "None",
+        "tick": tick,
+        "playing": bool(flags & FLAG_PLAYING),
+        "goal": _pick(flags, FLAG_GOAL_1, FLAG_GOAL_2, "1", "2", "None"),
+        "game": {
+            "scoreLimit": score_limit,
+            "pause": bool(flags & FLAG_PAUSE),
+            # cases calculees par le serveur, identiques a celles de l'etat JSON
+            "ai_data": [
+                ball_bucket_x,
+                ball_bucket_y,
+                angle_tenths / 10,
+                paddle2_bucket,
+                [ai_side, ai_y],
+                raw_paddle2_y,
+            ],
+        },
+        "ball": {
+            "x": ball_x,
+            "y": ball_y,
+            "speed": speed,
+            "lastTouch": _pick(flags, FLAG_TOUCH_1, FLAG_TOUCH_2, "1", "2", 0),
+            "touchedWall": _pick(flags, FLAG_WALL_TOP, FLAG_WALL_BOTTOM, "top", "bottom", None),
+            "rounded_angle": angle_halves / 2,
+            "next_collision": [collision_side, collision_y],
+        },
+        "paddle1": {"x": PADDLE1_X, "y": paddle1_y, "score": score1,
+                    "sequence": sequence1 if flags & FLAG_SEQUENCE_1 else None},
+        "paddle2": {"x": PADDLE2_X, "y": paddle2_y, "score": score2,
+                    "sequence": sequence2 if flags & FLAG_SEQUENCE_2 else None},
+        "gameover": "Score" if flags & FLAG_GAMEOVER else None,
+        "winner": _pick(flags, FLAG_WINNER_1, FLAG_WINNER_2, "1", "2", None),
+        "game_mode": GAME_MODES.get(mode),
+        "resumeOnGoal": bool(flags & FLAG_RESUME_ON_GOAL),
+        "side": _pick(flags, FLAG_SIDE_P1, FLAG_SIDE_P2, "p1", "p2", None),
+    }
+
+
+def encode_input(direction: int, sequence: int, player: int = 0, tick=None) -> bytes:
+    if tick is not None:
+        return INPUT_MESSAGE_TICK.pack(player, direction, sequence & 0xFFFF, tick)
+    return INPUT_MESSAGE.pack(player, direction, sequence & 0xFFFF)
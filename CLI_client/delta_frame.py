@@ -0,0 +1,38 @@
+import copy
+
+# Reconstruction des etats du sous-protocole "pong.delta.v1" : le serveur envoie
+# une image complete ("frame": "key") puis seulement les champs modifies par
+# rapport a cette image ("frame": "delta").
+
+DELTA_SUBPROTOCOL = "pong.delta.v1"
+
+
+def apply_changes(base: dict, changes: dict) -> dict:
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            apply_changes(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+class DeltaDecoder:
+
+    def __init__(self):
+        self.keyframe = None
+
+    def decode(self, data: dict):
+        frame = data.get('frame')
+        if frame == 'key':
+            self.keyframe = data
+            return data
+        if frame != 'delta':
+            return data
+        if self.keyframe is None or data.get('key') != self.keyframe.get('key'):
+            # delta sur une image qu'on n'a pas : on attend la prochaine image complete
+            return None
+        state = apply_changes(copy.deepcopy(self.keyframe), data['changes'])
+        state['frame'] = 'delta'
+        state['tick'] = data['tick']
+        state['side'] = data.get('side', state.get('side'))
+        return state
@@ -2,6 +2,7 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 import pong.routing
+from pong.shutdown import lifespan, install_reactor_hook
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PongGame.settings')
 django_asgi_app = get_asgi_application()
@@ -11,4 +12,7 @@ application = ProtocolTypeRouter({
     "websocket": URLRouter(
         pong.routing.websocket_urlpatterns
     ),
-})
\ No newline at end of file
+    "lifespan": lifespan,
+})
+
+install_reactor_hook()
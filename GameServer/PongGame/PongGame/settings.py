@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -14,6 +15,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.staticfiles',
     'corsheaders',
+    'pong',
 ]
 
 MIDDLEWARE = [
@@ -72,11 +74,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 ASGI_APPLICATION = "PongGame.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Channel layer en memoire par defaut (un seul processus daphne). Avec CHANNEL_REDIS_URL
+# (Redis ou serveur compatible, ex. redis://localhost:6379), les etats et messages de groupe
+# passent par Redis et plusieurs workers daphne peuvent servir les clients.
+if os.getenv('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.getenv('CHANNEL_REDIS_URL')],
+                # une frame en retard est remplacee par la suivante, inutile de la garder longtemps
+                "expiry": 10,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
 
 CHANNEL_LAYERS_OPTIONS = {
     "websocket_timeout": 30,
@@ -2,10 +2,18 @@ import json
 import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .game.game_wrapper import GameWrapper
+from .game.game_status import GameStatus
+from .game.lobby import LOBBY_COUNTDOWN_TICKS, LobbyState
 import logging
 import aiohttp
 from enum import Enum
 from .game.game_manager import game_manager
+from .http_client import internal_http
+from .game_ticket import issue_ticket, token_digest, verify_ticket
+from .jwt_cache import jwt_cache
+from .game_shard import shard_of
+from .send_queue import SendQueue
+from .game.frame import BINARY_SUBPROTOCOL, DELTA_SUBPROTOCOL, INPUT_MESSAGE, INPUT_MESSAGE_TICK, SPECTATOR_SUBPROTOCOL, frame_event, spectator_event, with_side, with_side_flags
 
 from urllib.parse import parse_qs
 import jwt
@@ -28,6 +36,12 @@ class ClientType(Enum):
     FRONT = 1
 
 
+# un spectateur bloque plus longtemps sur un envoi est deconnecte (secondes)
+SPECTATOR_MAX_STALL = 1.0
+# duree pendant laquelle une partie coupee (1006) attend le retour du joueur (secondes)
+RECONNECT_GRACE = 10
+
+
 class Errors(Enum):
     WRONG_UID = 1
     WRONG_TOKEN = 2
@@ -46,12 +60,21 @@ class PongConsumer(AsyncWebsocketConsumer):
     error_on_connect = 0
     client = None
     sleeping = False
-    message_timestamp = 0
     jwt_token = None
+    binary_frames = False
+    delta_frames = False
+    delta_key = None
+    # connexion refusee (partie pleine, mauvais shard) ou partie deplacee : la partie ne lui appartient pas
+    rejected = False
+    # reconnexion a une partie existante (?resume=1), par exemple apres une migration
+    resuming = False
+    # joueur parti sur une coupure reseau, la partie l'attend encore
+    in_grace = False
+    connect_started = None
+    send_queue = None
+    spectator = False
 
 
-    clients = {}
-
     def decode_jwt_unsafe(self, token):
         try:
             header_b64, payload_b64, _ = token.split('.')
@@ -84,6 +107,12 @@ class PongConsumer(AsyncWebsocketConsumer):
 #                 logging.info("Token de service validé")
                 return True
 
+            # token deja verifie et pas encore expire : pas de nouveau decodage
+            cached_payload = jwt_cache.get(token)
+            if cached_payload is not None:
+                self.user = cached_payload.get('username')
+                return True
+
             unsafe_payload = self.decode_jwt_unsafe(token)
             if not unsafe_payload:
                 logging.error("Échec du décodage base64")
@@ -111,6 +140,7 @@ class PongConsumer(AsyncWebsocketConsumer):
                 return False
 
             self.user = secure_payload.get('username')
+            jwt_cache.put(token, secure_payload)
 #             logging.info(f"JWT validé pour l'utilisateur: {self.user}")
 
             return True
@@ -127,6 +157,7 @@ class PongConsumer(AsyncWebsocketConsumer):
 
 
     async def connect(self):
+        self.connect_started = time.monotonic()
 
         # logging.info(f"tentative de Connexion de {self.scope['user']}")
 
@@ -136,43 +167,161 @@ class PongConsumer(AsyncWebsocketConsumer):
             await self.close(4001)
             return
 
-        
-        if not await self.verify_game_uid():
+
+        # la partie appartient a un autre shard : nginx aurait du y envoyer le client
+        self.game_id = self.scope['url_route']['kwargs']['uid']
+        if not game_manager.owns(self.game_id):
+            logging.error(f"game {self.game_id} belongs to shard {shard_of(self.game_id)}, not {game_manager.shard_id}")
+            self.rejected = True
+            await self.close(4006)
+            return
+
+        game_manager.ensure_listener(self.channel_layer)
+        game_manager.ensure_reaper(self.channel_layer)
+        self.resuming = self.query_param('resume') == '1'
+
+        if SPECTATOR_SUBPROTOCOL in self.scope.get('subprotocols', []):
+            await self.connect_spectator()
+            return
+
+        # reconnexion : la partie locale attend deja ce token, pas besoin de verifier l'uid
+        trusted = self._resume_from_token()
+        if not trusted and not await self.verify_game_uid():
             logging.error("verify game uid failed")
+            self.game_wrapper = None
             await self.disconnect(4002)
             await self.close(4002)
             return
 
-        self.game_wrapper = await game_manager.create_or_get_game(self.game_id)
+        if self.resuming:
+            self.game_wrapper = await game_manager.receive_migrated_game(self.game_id, self.channel_layer)
+        else:
+            self.game_wrapper = await game_manager.create_or_get_game(self.game_id)
+        if self.game_wrapper is None or ((self.resuming or self.game_wrapper.restored) and not self._can_resume()):
+            logging.error(f"cannot resume game {self.game_id}")
+            self.game_wrapper = None
+            self.rejected = True
+            await self.close(4002)
+            return
+
+        subprotocol = self.scope.get('subprotocols', [''])[0]
+        # etats de jeu en binaire si le client le demande en plus du token
+        self.binary_frames = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.delta_frames = DELTA_SUBPROTOCOL in self.scope.get('subprotocols', [])
 
+        # les etats et messages de la partie passent par le groupe du channel layer
         self.group_name = f"pong_{self.game_id}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-
-        if self.group_name not in self.clients:
-            self.clients[self.group_name] = []
-        if len(self.clients[self.group_name]) == 2:
+        if len(self.game_wrapper.connections) == 2:
             logging.error(f"Group {self.group_name} is full")
+            # la partie en cours n'est pas touchee par le disconnect qui suit
+            self.game_wrapper = None
+            self.rejected = True
             await self.close(4005)
-        else:
-            self.clients[self.group_name].append(self)
-        # logging.info(f"in connect, number of groups: {len(self.clients)}\nName of groups: {self.clients.keys()}\nsize of current group[channel_name]: {len(self.clients[self.group_name])}")
-
+            return
+        self.game_wrapper.connections[self.channel_name] = self.frame_format()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
 
-        subprotocol = self.scope.get('subprotocols', [''])[0]
-        
         await self.accept(subprotocol=subprotocol)
 
+        # les messages du groupe passent par la file du client, videe par son propre writer
+        self.send_queue = SendQueue()
+        self.game_wrapper.tasks.spawn(self.send_queue.run(self.deliver), "writer", owner=self.channel_name)
+
         await self._initialize_game_mode()
         # logging.info(f"Game mode: {self.mode}")
 #         logging.info(f"number of connected players: {self.game_wrapper.present_players}")
 
         await self.get_name_from_jwt()
+        if self.resuming:
+            await self.broadcast({"type": "opponent_reconnected", "side": self.side}, exclude=self.channel_name)
 
         if self.is_main is True:
-            asyncio.ensure_future(self.generate_states())
+            self.start_frame_loop()
+
+        elif self.game_wrapper.suspended:
+            self.game_wrapper.tasks.spawn(self.wait_for_resume(), "wait_for_resume", owner=self.channel_name)
+
+        else:
+            self.game_wrapper.tasks.spawn(self.wait_for_second_player(), "wait_for_second_player", owner=self.channel_name)
 
+    def start_frame_loop(self):
+        if self.game_wrapper.frame_loop_running:
+            return
+        self.game_wrapper.frame_loop_running = True
+        self.game_wrapper.main_side = self.side
+        # la boucle appartient a la partie : elle survit au depart du client qui l'a lancee
+        self.game_wrapper.tasks.spawn(self.generate_states(), "generate_states")
+
+    async def wait_for_resume(self):
+        # l'autre cote ne revient pas : la partie repart sans lui
+        try:
+            await asyncio.wait_for(self.game_wrapper.resumed.wait(), RECONNECT_GRACE)
+        except asyncio.TimeoutError:
+            if self.game_wrapper is not None and self.game_wrapper.suspended:
+                logging.warning(f"resuming {self.game_id} without all players")
+                self.start_frame_loop()
+
+    async def connect_spectator(self):
+        # un spectateur ne cree pas de partie et n'occupe pas de place de joueur
+        if self.resuming:
+            self.game_wrapper = await game_manager.receive_migrated_game(self.game_id, self.channel_layer)
         else:
-            asyncio.ensure_future(self.wait_for_second_player())
+            self.game_wrapper = game_manager.active_games.get(self.game_id)
+        if self.game_wrapper is None:
+            logging.error(f"no game {self.game_id} to spectate")
+            self.rejected = True
+            await self.close(4002)
+            return
+
+        self.spectator = True
+        self.binary_frames = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.group_name = f"pong_{self.game_id}_spectators"
+        self.game_wrapper.spectators[self.channel_name] = "binary" if self.binary_frames else "json"
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=self.scope.get('subprotocols', [''])[0])
+
+        # une seule frame en attente : un spectateur lent perd des images avant les joueurs
+        self.send_queue = SendQueue(max_frames=1)
+        self.game_wrapper.tasks.spawn(self.send_queue.run(self.deliver), "spectator_writer", owner=self.channel_name)
+        await self.send(json.dumps({"type": "greetings", "side": "spectator"}))
+        await self.send(json.dumps({
+            "type": "names",
+            "p1": self.game_wrapper.player_1.name,
+            "p2": self.game_wrapper.player_2.name
+        }))
+
+    def query_param(self, name):
+        return parse_qs(self.scope.get('query_string', b'').decode()).get(name, [None])[0]
+
+    def frame_format(self):
+        if self.binary_frames:
+            return "binary"
+        if self.delta_frames:
+            return "delta"
+        return "json"
+
+    async def broadcast(self, data, exclude=None):
+        # message de controle JSON pour tous les clients de la partie, quel que soit leur processus
+        await self.channel_layer.group_send(self.group_name, {
+            "type": "game.message",
+            "text": json.dumps(data),
+            "exclude": exclude,
+        })
+
+    async def game_message(self, event):
+        if event.get("exclude") != self.channel_name and self.send_queue is not None:
+            self.send_queue.push_message(event["text"])
+
+    async def deliver(self, kind, payload):
+        if kind == "message":
+            await self.send(text_data=payload)
+        elif kind == "spectator":
+            if self.binary_frames:
+                await self.send(bytes_data=payload["bytes"])
+            else:
+                await self.send(text_data=payload["text"])
+        else:
+            await self.send_state_frame(payload)
 
     async def get_name_from_jwt(self):
 
@@ -200,37 +349,42 @@ class PongConsumer(AsyncWebsocketConsumer):
 
     async def wait_for_second_player(self):
         try:
-            timestamp = time.time()
             timeout = 10  # 10 secondes
             if self.mode == GameMode.PVP_LAN.value:
                 timeout = 5
     
-            while time.time() - timestamp < timeout:
-                if self.game_wrapper.all_players_connected.is_set():
-                    if self.game_wrapper.player_1.name not in (None, 'guest') and self.game_wrapper.player_1.name == self.game_wrapper.player_2.name:
-                        for client in self.clients[self.group_name]:
-                            await client.send(json.dumps({
-                            "type": "same_jwt",
-                        }))
-                        self.error_on_connect = Errors.SAME_JWT.value
-                        await self.disconnect(close_code=4003)
-                        await self.close(code=4003)
-                        return
-                        
-                    for client in self.clients[self.group_name]:
-                        await client.send(json.dumps({
-                           "type": "opponent_connected",
-                           "opponent_connected": True
-                        }))
-                        await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                        }))
-                        # logging.info("sent names")
-                    # logging.info("Second player connected successfully")
+            try:
+                # reveille des que le second joueur rejoint, sans sonder l'evenement
+                await asyncio.wait_for(self.game_wrapper.all_players_connected.wait(), timeout)
+            except asyncio.TimeoutError:
+                connected = False
+            else:
+                connected = True
+
+            if connected:
+                if self.game_wrapper.player_1.name not in (None, 'guest') and self.game_wrapper.player_1.name == self.game_wrapper.player_2.name:
+                    # envoye directement a ce client, qui ferme juste apres
+                    await self.send(json.dumps({"type": "same_jwt"}))
+                    await self.broadcast({
+                        "type": "same_jwt",
+                    }, exclude=self.channel_name)
+                    self.error_on_connect = Errors.SAME_JWT.value
+                    await self.disconnect(close_code=4003)
+                    await self.close(code=4003)
                     return
-                await asyncio.sleep(0.1)
+                    
+                await self.broadcast({
+                   "type": "opponent_connected",
+                   "opponent_connected": True
+                })
+                await self.broadcast({
+                   "type": "names",
+                   "p1": self.game_wrapper.player_1.name,
+                   "p2": self.game_wrapper.player_2.name
+                })
+                # logging.info("sent names")
+                # logging.info("Second player connected successfully")
+                return
     
             # Timeout atteint
             logging.error("Timeout waiting for second player")
@@ -258,42 +412,94 @@ class PongConsumer(AsyncWebsocketConsumer):
         if self.game_id is None:
             self.error_on_connect = Errors.WRONG_UID.value
             return False
-        async with aiohttp.ClientSession() as session:
-                verify_url = f"https://nginx:7777/game/verify/{self.game_id}/"
-                headers = await self.generate_headers()
-#                 # logging.info(f"in verify game_uid: headers: {headers}")
 
-                try:
-                    async with session.get(
-                            verify_url,
-                            ssl=False,
-                            headers=headers
-                    ) as response:
-                        # logging.info(f"verify uid response: {response}")
-                        response_text = await response.text()
-                        # logging.info(f"response.text: {response_text}")
-                        if response.status not in [200]:  # On accepte 404 si le jeu est déjà nettoyé
-                            # logging.error(f"verify failed: {response.status}")
-                            # logging.error(f"Response: {response_text}")
-                            return False
-                        else:
-#                             # logging.info(f"verify successful for game {self.game_id}")
-                            return True
-                except Exception as e:
-                    logging.error(f"verify request error: {str(e)}")
-                    return False
+        # ticket signe par le matchmaking : verifie sur place, sans appel reseau
+        ticket = self.query_param('ticket')
+        secret = os.getenv('GAME_TICKET_SECRET')
+        if ticket and secret:
+            if verify_ticket(secret, ticket, self.game_id, self.jwt_token):
+                return True
+            logging.warning(f"invalid game ticket for {self.game_id}, falling back to verify request")
+
+        headers = await self.generate_headers()
+        try:
+            status, response_text = await internal_http.request(
+                "GET", "verify", f"/game/verify/{self.game_id}/", headers=headers)
+            return status == 200
+        except Exception as e:
+            logging.error(f"verify request error: {str(e)}")
+            return False
 
 
 #*********************GAME MODE INITIALIZATION START********************************
     async def _initialize_game_mode(self):
         if self._is_shared_screen_mode():
             self._init_shared_screen()
+        elif self.resuming or self.game_wrapper.restored:
+            self._init_resumed_side()
         elif self._is_lan_mode():
             self._init_lan_mode()
         else:
             self._init_pve_mode()
+        self._record_token()
         await self.send(json.dumps({"type": "greetings", "side": self.side}))
 
+    def _record_token(self):
+        # le cote tenu par ce client, retrouve par son token s'il se reconnecte
+        digest = token_digest(self.jwt_token or '')
+        if self.mode == GameMode.PVP_KEYBOARD.value or self.side == "p1":
+            self.game_wrapper.player_1.token_digest = digest
+        if self.mode == GameMode.PVP_KEYBOARD.value or self.side == "p2":
+            self.game_wrapper.player_2.token_digest = digest
+
+
+    #********************RESUMED GAME INITIALIZATION START*****************************
+    def _resumable_player(self):
+        digest = token_digest(self.jwt_token or '')
+        for side, player in (("p1", self.game_wrapper.player_1), ("p2", self.game_wrapper.player_2)):
+            if player.token_digest == digest and not player.is_connected:
+                return side, player
+        return None, None
+
+    def _can_resume(self):
+        return self._resumable_player()[0] is not None
+
+    def _resume_from_token(self):
+        # une partie suspendue reconnait son joueur a son token, meme si ?resume=1 s'est perdu
+        wrapper = game_manager.active_games.get(self.game_id)
+        if wrapper is None or not (self.resuming or wrapper.suspended):
+            return False
+        self.game_wrapper = wrapper
+        if not self._can_resume():
+            self.game_wrapper = None
+            return False
+        self.resuming = True
+        return True
+
+    def _init_resumed_side(self):
+        # partie importee ou coupure reseau : le client retrouve le cote associe a son token
+        self.mode = GameMode.PVP_LAN.value if self._is_lan_mode() else GameMode.PVE.value
+        self.client = ClientType.FRONT.value
+        self.side, player = self._resumable_player()
+        self._reattach(player)
+        self.game_wrapper.present_players += 1
+        # le dernier cote revenu relance la boucle des etats
+        self.is_main = self.game_wrapper.player_1.is_connected and self.game_wrapper.player_2.is_connected
+        if self.is_main:
+            self.game_wrapper.resumed.set()
+
+    def _reattach(self, player):
+        player.is_connected = True
+        self.game_wrapper.tasks.cancel(f"grace_{player.token_digest}")
+        # nouvelle connexion : le client repart de sa propre sequence d'entrees
+        player.paddle.inputs.reset()
+        player.paddle.action = 0
+        if player.disconnected_at is not None:
+            game_manager.record_rejoin(time.monotonic() - self.connect_started, time.monotonic() - player.disconnected_at)
+            player.disconnected_at = None
+
+    #********************RESUMED GAME INITIALIZATION END*******************************
+
 
     #********************SHARED SCREEN MODE INITIALIZATION START*********************
     def _is_shared_screen_mode(self):
@@ -308,10 +514,14 @@ class PongConsumer(AsyncWebsocketConsumer):
 
         for player in [self.game_wrapper.player_1, self.game_wrapper.player_2]:
             player.type = PlayerType.HUMAN.value
+            if self.resuming or self.game_wrapper.restored:
+                self._reattach(player)
             player.is_connected = True
 
         self.game_wrapper.all_players_connected.set()
+        self.game_wrapper.set_status(GameStatus.STARTING)
         self.game_wrapper.ai_is_initialized.set()
+        self.game_wrapper.resumed.set()
         self.game_wrapper.game.RUNNING_AI = False
 
     #********************SHARED SCREEN MODE INITIALIZATION STOP************************
@@ -344,6 +554,7 @@ class PongConsumer(AsyncWebsocketConsumer):
         self.is_main = True
         self.game_wrapper.player_2.is_connected = True
         self.game_wrapper.all_players_connected.set()
+        self.game_wrapper.set_status(GameStatus.STARTING)
         # logging.info("all players are connected")
         self.game_wrapper.player_2.type = PlayerType.HUMAN.value
 
@@ -403,6 +614,7 @@ class PongConsumer(AsyncWebsocketConsumer):
 
         self.is_main = True
         self.game_wrapper.all_players_connected.set()
+        self.game_wrapper.set_status(GameStatus.STARTING)
         # logging.info("all players are connected")
 
     #*********************PVE MODE INITIALIZATION sideEND********************************
@@ -417,6 +629,7 @@ class PongConsumer(AsyncWebsocketConsumer):
                 self.game_wrapper.present_players = max(0, self.game_wrapper.present_players - 1)
                 self.game_wrapper.game.pause = True
                 self.game_wrapper.game_over.set()
+                self.game_wrapper.set_status(GameStatus.CANCELLED)
                 
                 if self.game_wrapper.present_players <= 0:
                     if hasattr(self, 'game_id'):
@@ -428,8 +641,6 @@ class PongConsumer(AsyncWebsocketConsumer):
         if self.game_wrapper is None or self.game_wrapper.start_event.is_set() == False:
             return
         try:
-            url = 'https://nginx:7777/auth/incrementusercounters/'
-            
             # Préparation des données dans le format attendu par request.POST
             form_data = aiohttp.FormData()
             form_data.add_field('token', self.jwt_token)
@@ -446,29 +657,88 @@ class PongConsumer(AsyncWebsocketConsumer):
                 'Content-Type': 'application/x-www-form-urlencoded',
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    data=form_data,
-                    headers=headers,
-                    ssl=False
-                ) as response:
-                    response_text = await response.text()
-                    if response.status == 200:
-                        response_data = json.loads(response_text)
-                        # logging.info(f"Stats updated successfully: goals={response_data['goal_counter']}, wins={response_data['win_counter']}")
-                    else:
-                        logging.error(f"Stats update failed: {response.status}")
-                        logging.error(f"Response: {response_text}")
+            status, response_text = await internal_http.request(
+                "POST", "stats", "/auth/incrementusercounters/", data=form_data, headers=headers)
+            if status == 200:
+                response_data = json.loads(response_text)
+                # logging.info(f"Stats updated successfully: goals={response_data['goal_counter']}, wins={response_data['win_counter']}")
+            else:
+                logging.error(f"Stats update failed: {status}")
+                logging.error(f"Response: {response_text}")
 
         except Exception as e:
             logging.error(f"Error sending stats: {str(e)}")
 
     async def disconnect(self, close_code):
         # logging.info(f"Disconnect, code: {close_code}")
+        if self.send_queue is not None:
+            stats = self.send_queue.stats()
+            if stats["dropped"]:
+                logging.warning(f"client {self.side} of {self.game_id} lagged: {stats}")
+            self.send_queue.close()
+        if self.game_wrapper is not None:
+            # writer et attentes du lobby de ce client ; la boucle des etats reste a la partie
+            self.game_wrapper.tasks.cancel(self.channel_name)
+        if self.spectator:
+            await self.disconnect_spectator()
+            return
+        if self.rejected:
+            return
         if close_code == 1006:
-            # logging.info(f"Disconnect for instance {id(self)}")
+            # coupure reseau en pleine partie : la partie attend le retour du joueur
+            if self.can_wait_for_reconnect():
+                await self.suspend_for_reconnect(close_code)
             return
+        await self.leave_game()
+
+    def controlled_players(self):
+        if self.mode == GameMode.PVP_KEYBOARD.value:
+            return [self.game_wrapper.player_1, self.game_wrapper.player_2]
+        if self.side == "p1":
+            return [self.game_wrapper.player_1]
+        if self.side == "p2":
+            return [self.game_wrapper.player_2]
+        return []
+
+    def can_wait_for_reconnect(self):
+        return (self.game_wrapper is not None
+                and self.game_wrapper.start_event.is_set()
+                and not self.game_wrapper.game_over.is_set()
+                and len(self.controlled_players()) > 0)
+
+    async def suspend_for_reconnect(self, close_code):
+        # la partie est figee et garde son GameWrapper ; le joueur revient avec ?resume=1
+        wrapper = self.game_wrapper
+        self.in_grace = True
+        try:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        except Exception as e:
+            logging.warning(f"Error discarding from channel layer: {str(e)}")
+        wrapper.connections.pop(self.channel_name, None)
+        for player in self.controlled_players():
+            player.is_connected = False
+            player.disconnected_at = time.monotonic()
+            wrapper.present_players = max(0, wrapper.present_players - 1)
+        wrapper.suspended = True
+        wrapper.set_status(GameStatus.PAUSED)
+        wrapper.resumed.clear()
+        # la boucle des etats s'arrete, elle sera relancee par le client qui revient
+        game_manager.scheduler.unregister(self.game_id)
+        await self.broadcast({"type": "opponent_disconnected", "grace": RECONNECT_GRACE})
+        wrapper.tasks.spawn(self.expire_reconnect_grace(), "reconnect_grace", owner=self.grace_owner())
+
+    def grace_owner(self):
+        # le delai de grace est annule par le retour du joueur, reconnu par son token
+        return f"grace_{self.controlled_players()[0].token_digest}"
+
+    async def expire_reconnect_grace(self):
+        await asyncio.sleep(RECONNECT_GRACE)
+        if self.game_wrapper is None or any(player.is_connected for player in self.controlled_players()):
+            return
+        logging.warning(f"player {self.side} of {self.game_id} did not come back")
+        await self.leave_game()
+
+    async def leave_game(self):
         try:
             if self.mode == "PVP_LAN":
                 await self.send_user_stats()
@@ -477,29 +747,16 @@ class PongConsumer(AsyncWebsocketConsumer):
             # logging.info(f"Starting disconnect for instance {id(self)}")
             # if hasattr(self, 'group_name'):
             #     logging.info(f"Group name: {self.group_name}")
-            # logging.info(f"Available groups: {list(self.clients.keys())}")
     
             if hasattr(self, 'group_name'):
                 try:
-                    await self.channel_layer.group_discard("pong", self.channel_name)
+                    await self.channel_layer.group_discard(self.group_name, self.channel_name)
                 except Exception as e:
                     logging.warning(f"Error discarding from channel layer: {str(e)}")
             
             try:
-                if (hasattr(self, 'clients') and hasattr(self, 'group_name') 
-                    and isinstance(self.clients, dict)  
-                    and self.group_name in self.clients):
-                    
-                    if self in self.clients[self.group_name]:
-                        self.clients[self.group_name].remove(self)
-                        # logging.info(f"Removed client from group {self.group_name}")
-                    
-                    if not self.clients[self.group_name]:
-                        del self.clients[self.group_name]
-                        # logging.info(f"Deleted empty group {self.group_name}")
-                    
-                    # logging.info(f"After cleanup - Number of groups: {len(self.clients)}")
-                    # logging.info(f"Groups remaining: {list(self.clients.keys())}")
+                if self.game_wrapper is not None:
+                    self.game_wrapper.connections.pop(self.channel_name, None)
             except Exception as e:
                 logging.warning(f"Error cleaning up clients: {str(e)}")
     
@@ -515,9 +772,12 @@ class PongConsumer(AsyncWebsocketConsumer):
             
             elif hasattr(self, 'game_wrapper') and self.game_wrapper:
                 try:
-                    self.game_wrapper.present_players = max(0, self.game_wrapper.present_players - 1)
+                    if not self.in_grace:
+                        self.game_wrapper.present_players = max(0, self.game_wrapper.present_players - 1)
                     self.game_wrapper.game.pause = True
                     self.game_wrapper.game_over.set()
+                    if self.game_wrapper.status != GameStatus.FINISHED:
+                        self.game_wrapper.set_status(GameStatus.CANCELLED)
                     
                     if self.game_wrapper.present_players <= 0:
                         if hasattr(self, 'game_id'):
@@ -537,43 +797,39 @@ class PongConsumer(AsyncWebsocketConsumer):
             logging.error(f"Error in disconnect: {str(e)}")
             logging.error(f"Full error details: {e.__class__.__name__}")
             logging.error(f"group_name: {getattr(self, 'group_name', 'Not set')}")
-            logging.error(f"Available groups: {list(getattr(self, 'clients', {}).keys())}")
+            logging.error(f"Connections: {list(getattr(self.game_wrapper, 'connections', {}).keys())}")
+
+    async def disconnect_spectator(self):
+        self.spectator = False
+        try:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        except Exception as e:
+            logging.warning(f"Error discarding from channel layer: {str(e)}")
+        if self.game_wrapper is not None:
+            self.game_wrapper.spectators.pop(self.channel_name, None)
+            self.game_wrapper = None
 
     async def send_cleanup_request(self):
 
-        base_url = f"https://nginx:7777"
         if self.game_id is None:
             self.game_id = self.scope['url_route']['kwargs']['uid']
-        async with aiohttp.ClientSession() as session:
-            # Cleanup request
-            cleanup_url = f"{base_url}/game/cleanup/{self.game_id}/"
-            headers = await self.generate_headers()
+        headers = await self.generate_headers()
 
-            try:
-                async with session.delete(
-                        cleanup_url,
-                        ssl=False,
-                        headers=headers
-                ) as response:
-                    response_text = await response.text()
-                    if response.status not in [200, 404]:
-                        logging.error(f"Cleanup failed: {response.status}")
-                        logging.error(f"Response: {response_text}")
-            except Exception as e:
-                logging.error(f"Cleanup request error: {str(e)}")
+        try:
+            status, response_text = await internal_http.request(
+                "DELETE", "cleanup", f"/game/cleanup/{self.game_id}/", headers=headers)
+            if status not in [200, 404]:
+                logging.error(f"Cleanup failed: {status}")
+                logging.error(f"Response: {response_text}")
+        except Exception as e:
+            logging.error(f"Cleanup request error: {str(e)}")
 
     async def send_gameover_to_remaining_client(self, data):
 #         logging.info(f"Sending gameover event to remaining client")
         if self.mode == "PVP_keyboard":
             return
-        remaining_client = None
-        for client in self.clients[self.group_name]:
-            if client != self:
-                remaining_client = client
-                break
-        if remaining_client is not None:
-            # logging.info(f"Sending gameover event to remaining client, data: {data}")
-            await remaining_client.send(json.dumps(data))
+        # logging.info(f"Sending gameover event to remaining client, data: {data}")
+        await self.broadcast(data, exclude=self.channel_name)
 
     async def generate_headers(self):
         headers = {
@@ -606,27 +862,58 @@ class PongConsumer(AsyncWebsocketConsumer):
 
         return winner
 
-    async def receive(self, text_data):
-        current_time = time.time()
-        if current_time - self.message_timestamp >= 1/80 or not text_data.startswith("{\"type\":\"keyDown"):
-            self.message_timestamp = time.time()
-            try:
-                event = json.loads(text_data)
-                if event["sender"] == "front" or event["sender"] == "cli":
-                    await self.handle_front_input(event)
-                elif event["sender"] == "AI":
-                    await self.handle_ai_input(event)
-                elif event["sender"] == "game":
-                    await self.handle_game_input(event)
-            except Exception as e:
-                self.logger.info(f"Error in receive: {e}")
-                await self.disconnect(4004)
-                await self.close(4004)
-                return
-        # else:
-        #     logging.info(f"SPAMMMMMMMMMMMMMMMMMMMMM")
+    async def receive(self, text_data=None, bytes_data=None):
+        # les spectateurs sont en lecture seule
+        if self.spectator:
+            return
+        if bytes_data is not None:
+            self.handle_binary_input(bytes_data)
+            return
+
+        try:
+            event = json.loads(text_data)
+            handlers = {
+                "front": self.handle_front_input,
+                "cli": self.handle_front_input,
+                "AI": self.handle_ai_input,
+                "game": self.handle_game_input,
+            }
+            handler = handlers.get(event["sender"])
+            if handler is not None:
+                await handler(event)
+        except Exception as e:
+            self.logger.info(f"Error in receive: {e}")
+            await self.disconnect(4004)
+            await self.close(4004)
+            return
+
+
+    def handle_binary_input(self, data):
+        # chemin rapide des entrees : pas de JSON, pas de coroutine
+        if self.game_wrapper is None or self.sleeping:
+            return
+        if len(data) == INPUT_MESSAGE.size:
+            player, direction, sequence = INPUT_MESSAGE.unpack(data)
+            tick = None
+        elif len(data) == INPUT_MESSAGE_TICK.size:
+            player, direction, sequence, tick = INPUT_MESSAGE_TICK.unpack(data)
+        else:
+            return
+        if direction not in (-1, 0, 1):
+            return
+
+        if player == 0:
+            player = 1 if self.side == "p1" else 2 if self.side == "p2" else 0
+        # seul le clavier partage peut piloter les deux raquettes
+        if self.mode != GameMode.PVP_KEYBOARD.value and f"p{player}" != self.side:
+            return
+        # l'entree est mise en file et appliquee par la physique au tick vise
+        if player == 1:
+            self.game_wrapper.player_1.push_input(direction, sequence, tick)
+        elif player == 2:
+            self.game_wrapper.player_2.push_input(direction, sequence, tick)
+
 
-    
     async def handle_game_input(self, event):
         if event["type"] == "gameover":
             await self.disconnect(4003)
@@ -686,21 +973,13 @@ class PongConsumer(AsyncWebsocketConsumer):
         else:
             self.game_wrapper.player_1.name = event["name"][0]
             self.game_wrapper.player_2.name = event["name"][1]
-        await asyncio.sleep(1)
-        for client in self.clients[self.group_name]:
-            await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                           }))
-        self.game_wrapper.received_names.set()
-        await asyncio.sleep(1)
-        for client in self.clients[self.group_name]:
-            await client.send(json.dumps({
-                           "type": "names",
-                           "p1": self.game_wrapper.player_1.name,
-                           "p2": self.game_wrapper.player_2.name
-                           }))
+        # chaque nom recu est renvoye aux clients deja dans le groupe ; le second joueur
+        # recoit aussi les noms a son arrivee (wait_for_second_player)
+        await self.broadcast({
+                       "type": "names",
+                       "p1": self.game_wrapper.player_1.name,
+                       "p2": self.game_wrapper.player_2.name
+                       })
         self.game_wrapper.received_names.set()
 
 
@@ -772,25 +1051,40 @@ class PongConsumer(AsyncWebsocketConsumer):
 
     async def generate_states(self):
         try:
+            # partie migree ou coupee : on repart sans le lobby
+            lobby = None if self.game_wrapper.suspended else self.game_wrapper.lobby
+            if lobby is not None:
+                # la boucle est lancee par le second joueur, a la fin de son connect
+                lobby.enter(LobbyState.CONNECTED, at=self.connect_started)
             # self.logger.info("in generate states")
             await self.game_wrapper.ai_is_initialized.wait()
             # self.logger.info("in generate states, ai is initialized")
             await self.game_wrapper.received_names.wait()
+            if lobby is not None:
+                lobby.enter(LobbyState.NAMED)
             # self.logger.info("in generate states, names received")
             await self.game_wrapper.start_event.wait()
             # self.logger.info("state gen set")
             x = 0
-            self.sleeping = True
-            await asyncio.sleep(2)
-            self.sleeping = False
+            if lobby is None:
+                self.game_wrapper.suspended = False
+            else:
+                lobby.enter(LobbyState.READY)
+                await self.run_countdown()
             # logging.info("starting game")
-            
-            async for state in self.game_wrapper.game.rungame():
+
+            self.game_wrapper.set_status(GameStatus.IN_PROGRESS)
+            states = game_manager.scheduler.register(self.game_id, self.game_wrapper.game)
+            while True:
+                frame = await states.get()
+                if frame is None:
+                    # partie retiree du scheduler (migration, coupure, fin de partie)
+                    return
                 if not hasattr(self, 'game_wrapper') or self.game_wrapper is None:
                     # logging.info("Game wrapper no longer exists, stopping generate_states")
                     return
-                    
-                state_dict = json.loads(state)
+
+                state_dict = frame.state
                 state_dict["game_mode"] = self.mode
                 
                 if self.game_wrapper.has_resumed.is_set() is False:
@@ -800,64 +1094,119 @@ class PongConsumer(AsyncWebsocketConsumer):
                     self.game_wrapper.has_resumed.clear()
     
                 try:
-                    if state_dict['winner'] is not None:
-                        winner = state_dict['winner']
-                    else:
-                        winner = None
-    
                     # Vérifier à nouveau si le groupe existe encore
-                    if not hasattr(self, 'group_name') or self.group_name not in self.clients:
+                    if not self.game_wrapper.connections:
                         # logging.info("Group no longer exists, stopping generate_states")
                         return
     
-                    for client in self.clients[self.group_name]:
-                        state_dict['side'] = client.side
-                        if winner is not None:
-                            state_dict = await self.determine_winner(state_dict, winner, client)
-                        await client.send(text_data=json.dumps(state_dict))
-                        await asyncio.sleep(0.0000001)
+                    # le corps commun est encode une seule fois par format utilise,
+                    # chaque consumer ajoute son champ "side" a la reception du message de groupe
+                    formats = set(self.game_wrapper.connections.values())
+                    spectators = self.spectator_tick(x, state_dict)
+                    if spectators:
+                        formats |= set(self.game_wrapper.spectators.values())
+                    event = frame_event(frame, formats, self.game_wrapper.delta_encoder)
+                    await self.channel_layer.group_send(self.group_name, event)
+                    if lobby is not None and lobby.state == LobbyState.COUNTDOWN:
+                        lobby.enter(LobbyState.PLAYING)
+                        game_manager.record_lobby(lobby)
+                    if spectators:
+                        await self.channel_layer.group_send(f"pong_{self.game_id}_spectators", spectator_event(event))
                         
                     if state_dict["gameover"] == "Score":
                         self.game_wrapper.game_over.set()
+                        self.game_wrapper.set_status(GameStatus.FINISHED)
                         return
-                        
-                    await self.move_paddles()
     
                 except Exception as e:
                     logging.error(f"Error in generate_states loop: {str(e)}")
                     return
     
                 x += 1
-                await asyncio.sleep(0.00000001)
 
         except Exception as e:
             logging.error(f"Error in generate_states: {str(e)}")
             return
 
-    async def move_paddles(self):
-        asyncio.create_task(self._move_paddle_1())
-        asyncio.create_task(self._move_paddle_2())
-
-    async def _move_paddle_1(self):
-        if self.game_wrapper.player_1.action == 1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle1.move(self.game_wrapper.game.height, up=True)
-                await asyncio.sleep(0)
-        elif self.game_wrapper.player_1.action == -1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle1.move(self.game_wrapper.game.height, up=False)
-                await asyncio.sleep(0)
-
-    async def _move_paddle_2(self):
-        if self.game_wrapper.player_2.action == 1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle2.move(self.game_wrapper.game.height, up=True)
-                await asyncio.sleep(0)
-        elif self.game_wrapper.player_2.action == -1:
-            for _ in range(5):
-                await self.game_wrapper.game.paddle2.move(self.game_wrapper.game.height, up=False)
-                await asyncio.sleep(0)
-
-    async def determine_winner(self, state_dict, winner, client):
-        state_dict["winner"] = winner
-        return state_dict
+        finally:
+            game_manager.scheduler.unregister(self.game_id)
+            if self.game_wrapper is not None:
+                self.game_wrapper.frame_loop_running = False
+
+    async def run_countdown(self):
+        # compte a rebours en ticks du scheduler, annonce aux joueurs pour caler leur affichage
+        self.game_wrapper.lobby.enter(LobbyState.COUNTDOWN)
+        await self.broadcast({
+            "type": "countdown",
+            "ticks": LOBBY_COUNTDOWN_TICKS,
+            "seconds": LOBBY_COUNTDOWN_TICKS / game_manager.scheduler.frame_rate
+        })
+        self.sleeping = True
+        try:
+            await game_manager.scheduler.wait_ticks(LOBBY_COUNTDOWN_TICKS)
+        finally:
+            self.sleeping = False
+
+    def spectator_tick(self, x, state_dict):
+        # frequence reduite pour les spectateurs, sauf quand l'etat de la partie change
+        wrapper = self.game_wrapper
+        if not wrapper.spectators:
+            return False
+        marker = (state_dict.get("goal"), state_dict.get("gameover"), state_dict.get("resumeOnGoal"))
+        changed = marker != wrapper.spectator_marker
+        wrapper.spectator_marker = marker
+        return changed or x % wrapper.spectator_interval == 0
+
+    async def spectator_frame(self, event):
+        if self.send_queue is None or self.send_queue.closed:
+            return
+        if self.send_queue.stalled_for() > SPECTATOR_MAX_STALL:
+            logging.warning(f"shedding slow spectator of {self.game_id}: {self.send_queue.stats()}")
+            self.send_queue.close()
+            await self.close(4007)
+            return
+        self.send_queue.push_frame(event, kind="spectator")
+
+    async def game_redirect(self, event):
+        # partie deplacee sur un autre shard : le client se reconnecte au nouvel uid avec ?resume=1
+        self.rejected = True
+        secret = os.getenv('GAME_TICKET_SECRET')
+        ticket = issue_ticket(secret, event["uid"], self.jwt_token) if secret and not self.spectator else None
+        if self.send_queue is not None:
+            self.send_queue.close()
+        try:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        except Exception as e:
+            logging.warning(f"Error discarding from channel layer: {str(e)}")
+        await self.send(json.dumps({"type": "redirect", "uid": event["uid"], "ticket": ticket}))
+        await self.close(4008)
+
+    async def game_expired(self, event):
+        # partie retiree par le reaper de game_manager
+        if self.send_queue is not None:
+            self.send_queue.close()
+        await self.send(json.dumps({
+            "type": "timeout",
+            "message": "Game expired",
+            "game_mode": self.mode
+        }))
+        await self.close(4009)
+
+    async def state_frame(self, event):
+        if self.send_queue is not None:
+            self.send_queue.push_frame(event)
+
+    async def send_state_frame(self, event):
+        if self.binary_frames:
+            await self.send(bytes_data=with_side_flags(event["binary"], event["flags"], self.side))
+
+        elif self.delta_frames:
+            # un client qui n'a pas encore l'image de reference la recoit avant le delta
+            if self.delta_key != event["key"]:
+                await self.send(text_data=with_side(event["keyframe"], self.side))
+                self.delta_key = event["key"]
+            if event["delta"] is not None:
+                await self.send(text_data=with_side(event["delta"], self.side))
+
+        else:
+            await self.send(text_data=with_side(event["json"], self.side))
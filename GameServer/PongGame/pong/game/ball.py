@@ -1,13 +1,15 @@
 import math
-import time
 import copy
 import random
 from .paddle import Paddle
+from .clock import RealClock
 import logging
 
 class Ball:
     
-    def __init__(self, x, y, radius, win_width, win_height):
+    def __init__(self, x, y, radius, win_width, win_height, clock=None, rng=None):
+        self.clock = clock if clock is not None else RealClock()
+        self.rng = rng if rng is not None else random
         self.lastTouch = 0
         self.touchedWall = None
         self.x = x
@@ -17,10 +19,14 @@ class Ball:
         self.max_speed = self.win_width * self.win_height / 2500000
         self.radius = radius
         self.x_vel = self.max_speed / 2.5
-        if random.choice((1, 2)) == 1:
+        if self.rng.choice((1, 2)) == 1:
             self.x_vel = -self.x_vel
         self.y_vel = 0
-        self.frictionTimestamp = time.time()
+        self.frictionTimestamp = self.clock.now()
+
+        # cache des collisions predites, invalide a chaque changement de trajectoire
+        self.trajectoryVersion = 0
+        self.predictions = {}
 
 
     def move(self):
@@ -32,17 +38,27 @@ class Ball:
         self.x = self.win_width // 2
         self.y = self.win_height // 2
         if x > 0:
-            goalAngle = random.uniform(-30, 30)
+            goalAngle = self.rng.uniform(-30, 30)
         else:
-            rng = random.choice((1, 2))
+            rng = self.rng.choice((1, 2))
             if rng == 1:
-                goalAngle = random.uniform(-150, -180)
+                goalAngle = self.rng.uniform(-150, -180)
             else:
-                goalAngle = random.uniform(150, 180)
+                goalAngle = self.rng.uniform(150, 180)
         angle_rad = math.radians(goalAngle)
         speed = self.max_speed / 3.5
         self.x_vel = speed * math.cos(angle_rad)
         self.y_vel = speed * math.sin(angle_rad)
+        self.invalidateTrajectory()
+
+
+    def invalidateTrajectory(self):
+        self.trajectoryVersion += 1
+
+
+    def bounceOnWall(self):
+        self.y_vel = -self.y_vel
+        self.invalidateTrajectory()
 
 
     # matrix
@@ -54,7 +70,7 @@ class Ball:
 
     def updateTrajectoryP2(self, paddle):
 
-        currentTs = time.time()
+        currentTs = self.clock.now()
 
         if paddle.lastTouch > currentTs - 0.5:
             return
@@ -109,6 +125,7 @@ class Ball:
                     goalAngle = 130
 
         self.lastTouch = "2"
+        self.invalidateTrajectory()
 
         self.x_vel = currentSpeed * (1 + (1 * (1-(currentSpeed / self.max_speed)))) * math.cos(math.radians(goalAngle))
         self.y_vel = currentSpeed * (1 + (1 * (1 - (currentSpeed / self.max_speed)))) * math.sin(math.radians(goalAngle))
@@ -125,7 +142,7 @@ class Ball:
 
     def updateTrajectoryP1(self, paddle):
 
-        currentTs = time.time()
+        currentTs = self.clock.now()
 
         if paddle.lastTouch > currentTs - 0.5:
             return
@@ -182,6 +199,7 @@ class Ball:
                     self.x += 2
 
         self.lastTouch = "1"
+        self.invalidateTrajectory()
 
         self.x_vel = currentSpeed * (1 + (1* (1-(currentSpeed / self.max_speed)))) * math.cos(math.radians(goalAngle))
         self.y_vel = currentSpeed * (1 + (1 * (1 - (currentSpeed / self.max_speed)))) * math.sin(math.radians(goalAngle))
@@ -205,14 +223,14 @@ class Ball:
         return False
 
 
-    def calculateNextCollisionPosition(self, paddle:Paddle):
+    def simulateNextCollisionPosition(self, paddle:Paddle):
         res = []
         if paddle.x < self.win_width // 2:
             res.append(-1)
         else:
             res.append(1)
-        tempBall = copy.deepcopy(self)
-        tempPaddle = copy.deepcopy(paddle)
+        tempBall = copy.copy(self)
+        tempPaddle = copy.copy(paddle)
 
         # Déplacement de la balle jusqu'à ce qu'elle atteigne la position x = paddle2_x
         while tempBall.check_collision(tempPaddle) == False and tempBall.x > 0 and tempBall.x < self.win_width:
@@ -230,6 +248,77 @@ class Ball:
         return res # Retourne la position y correspondant
 
 
+    def predictNextCollision(self, paddle:Paddle):
+        # la prediction ne change pas tant que la trajectoire n'a pas ete modifiee
+        cached = self.predictions.get(paddle.x)
+        if cached is not None and cached[0] == self.trajectoryVersion:
+            return cached[1]
+        res = self.calculateNextCollisionPosition(paddle)
+        self.predictions[paddle.x] = (self.trajectoryVersion, res)
+        return res
+
+
+    def stepsBeforeCollision(self, paddle:Paddle):
+        # nombre de frames avant que la balle touche la zone de la raquette ou sorte du terrain,
+        # avec les memes conditions que simulateNextCollisionPosition
+        if self.check_collision(paddle) or self.x <= 0 or self.x >= self.win_width or self.x_vel == 0:
+            return 0
+        zoneStart = paddle.x - self.radius
+        zoneEnd = paddle.x + paddle.width + self.radius
+        if self.x_vel > 0:
+            steps = max(1, math.floor((zoneStart - self.x) / self.x_vel) + 1)
+            x = self.x + steps * self.x_vel
+            toWall = max(1, math.ceil((self.win_width - self.x) / self.x_vel))
+            if zoneStart < x < zoneEnd:
+                return min(steps, toWall)
+        else:
+            speed = -self.x_vel
+            steps = max(1, math.floor((self.x - zoneEnd) / speed) + 1)
+            x = self.x + steps * self.x_vel
+            toWall = max(1, math.ceil(self.x / speed))
+            if zoneStart < x < zoneEnd:
+                return min(steps, toWall)
+        return toWall
+
+
+    def calculateNextCollisionPosition(self, paddle:Paddle):
+        # version analytique de simulateNextCollisionPosition : la trajectoire est depliee
+        # sur les murs haut/bas, la position finale est obtenue par modulo sur la periode
+        side = -1 if paddle.x < self.win_width // 2 else 1
+        steps = self.stepsBeforeCollision(paddle)
+        y = self.y
+        vel = self.y_vel
+        if steps == 0 or vel == 0:
+            return [side, y]
+
+        top = self.radius
+        bottom = self.win_height - self.radius
+        speed = abs(vel)
+        nextY = y + vel
+        if not top < y < bottom and not top < nextY < bottom:
+            # balle hors du terrain et qui s'en eloigne : cas degenere, on garde la simulation
+            return self.simulateNextCollisionPosition(paddle)
+
+        # premier rebond sur un mur
+        if vel < 0:
+            firstBounce = max(1, math.ceil((y - top) / speed))
+        else:
+            firstBounce = max(1, math.ceil((bottom - y) / speed))
+        if steps < firstBounce:
+            return [side, y + steps * vel]
+
+        # apres le premier rebond le mouvement est periodique : aller-retour de period frames
+        wall = y + firstBounce * vel
+        if vel < 0:
+            period = max(1, math.ceil((bottom - wall) / speed))
+        else:
+            period = max(1, math.ceil((wall - top) / speed))
+        phase = (steps - firstBounce) % (2 * period)
+        if phase > period:
+            phase = 2 * period - phase
+        return [side, wall - vel * phase]
+
+
     def serialize(self, game):
         res:dict = {}
         res["x"] = self.x / game.width
@@ -239,14 +328,16 @@ class Ball:
         res["touchedWall"] = self.touchedWall
         res["rounded_angle"] = round((math.atan2(self.y_vel, self.x_vel)), 2)
         res["rounded_angle"] = round(math.atan2(self.y_vel, self.x_vel) * 2) / 2
-        res["next_collision"] = self.calculateNextCollisionPosition(game.paddle2)
+        res["next_collision"] = self.predictNextCollision(game.paddle2)
         self.touchedWall = None
 
         return res
     def friction(self):
-        if time.time() - self.frictionTimestamp > 0.4 and math.sqrt(self.x_vel ** 2 + self.y_vel ** 2) > self.max_speed / 5:
-            self.frictionTimestamp = time.time()
+        now = self.clock.now()
+        if now - self.frictionTimestamp > 0.4 and math.sqrt(self.x_vel ** 2 + self.y_vel ** 2) > self.max_speed / 5:
+            self.frictionTimestamp = now
             self.x_vel = self.x_vel * 0.93
             self.y_vel = self.y_vel * 0.93
+            self.invalidateTrajectory()
 
 
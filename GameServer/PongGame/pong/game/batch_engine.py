@@ -0,0 +1,298 @@
+import numpy as np
+
+from .game import Game
+from .clock import RealClock, TickClock
+
+
+# Ball.touchedWall pour chaque valeur de touched_wall
+WALLS = (None, "top", "bottom")
+
+
+# Moteur vectorise : l'etat de N parties est stocke dans des tableaux numpy
+# (une case par partie) et toutes les parties avancent d'un tick en un seul appel.
+# Les regles reprennent exactement celles de Ball / Paddle / Game.
+# Reserve aux usages hors ligne (simulations en masse, entrainement de l'IA) : le
+# GameScheduler fait toujours avancer les parties en ligne via Game.
+class BatchGame:
+
+    def __init__(self, count, seed=None, clock=None):
+        reference = Game()
+        self.clock = clock if clock is not None else RealClock()
+        if isinstance(self.clock, TickClock) and self.clock.tick_rate is None:
+            self.clock.tick_rate = reference.physics_rate
+        # le batch fait avancer l'horloge a la place des parties qu'il contient
+        self.clock.owner = self
+        self.count = count
+        self.width = reference.width
+        self.height = reference.height
+        self.scoreLimit = reference.scoreLimit
+        self.rng = np.random.default_rng(seed)
+
+        # constantes communes a toutes les parties
+        self.radius = reference.ball.radius
+        self.max_speed = reference.ball.max_speed
+        self.paddle_width = reference.paddle1.width
+        self.paddle_height = reference.paddle1.height
+        self.paddle_speed = reference.paddle1.speed
+        self.tick_duration = 1 / reference.physics_rate
+        self.paddle1_x = reference.paddle1.x
+        self.paddle2_x = reference.paddle2.x
+
+        # balle
+        self.ball_x = np.full(count, reference.width // 2, dtype=np.float64)
+        self.ball_y = np.full(count, reference.height // 2, dtype=np.float64)
+        self.ball_x_vel = np.where(self.rng.integers(1, 3, count) == 1, -1.0, 1.0) * (reference.ball.max_speed / reference.speed_multiplier / 2.5)
+        self.ball_y_vel = np.zeros(count)
+        self.ball_last_touch = np.zeros(count, dtype=np.int8)
+        self.touched_wall = np.zeros(count, dtype=np.int8)
+        self.friction_timestamp = np.full(count, self.clock.now())
+
+        # raquettes
+        self.paddle1_y = np.full(count, reference.paddle1.y, dtype=np.float64)
+        self.paddle2_y = np.full(count, reference.paddle2.y, dtype=np.float64)
+        self.paddle1_last_touch = np.full(count, -np.inf)
+        self.paddle2_last_touch = np.full(count, -np.inf)
+        self.paddle1_can_move = np.ones(count, dtype=bool)
+        self.paddle2_can_move = np.ones(count, dtype=bool)
+        self.action1 = np.zeros(count, dtype=np.int8)
+        self.action2 = np.zeros(count, dtype=np.int8)
+        self.score1 = np.zeros(count, dtype=np.int32)
+        self.score2 = np.zeros(count, dtype=np.int32)
+
+        # etat des parties
+        self.pause = np.zeros(count, dtype=bool)
+        self.goal1 = np.zeros(count, dtype=bool)
+        self.goal2 = np.zeros(count, dtype=bool)
+        self.tick = 0
+
+
+    @classmethod
+    def from_games(cls, games, seed=None, clock=None):
+        batch = cls(len(games), seed=seed, clock=clock)
+        for i, game in enumerate(games):
+            batch.load_game(i, game)
+        return batch
+
+
+    def load_game(self, i, game: Game):
+        ball = game.ball
+        self.ball_x[i] = ball.x
+        self.ball_y[i] = ball.y
+        self.ball_x_vel[i] = ball.x_vel
+        self.ball_y_vel[i] = ball.y_vel
+        self.ball_last_touch[i] = int(ball.lastTouch)
+        self.touched_wall[i] = WALLS.index(ball.touchedWall)
+        self.friction_timestamp[i] = ball.frictionTimestamp
+        self.paddle1_y[i] = game.paddle1.y
+        self.paddle2_y[i] = game.paddle2.y
+        self.paddle1_last_touch[i] = game.paddle1.lastTouch
+        self.paddle2_last_touch[i] = game.paddle2.lastTouch
+        self.paddle1_can_move[i] = game.paddle1.canMove
+        self.paddle2_can_move[i] = game.paddle2.canMove
+        self.action1[i] = game.paddle1.action
+        self.action2[i] = game.paddle2.action
+        self.score1[i] = game.paddle1.score
+        self.score2[i] = game.paddle2.score
+        self.pause[i] = game.pause
+        self.goal1[i] = game.goal1
+        self.goal2[i] = game.goal2
+
+
+    def store_game(self, i, game: Game):
+        ball = game.ball
+        ball.x = float(self.ball_x[i])
+        ball.y = float(self.ball_y[i])
+        ball.x_vel = float(self.ball_x_vel[i])
+        ball.y_vel = float(self.ball_y_vel[i])
+        ball.lastTouch = str(self.ball_last_touch[i]) if self.ball_last_touch[i] else 0
+        ball.touchedWall = WALLS[self.touched_wall[i]]
+        ball.frictionTimestamp = float(self.friction_timestamp[i])
+        ball.invalidateTrajectory()
+        game.paddle1.y = float(self.paddle1_y[i])
+        game.paddle2.y = float(self.paddle2_y[i])
+        game.paddle1.lastTouch = float(self.paddle1_last_touch[i])
+        game.paddle2.lastTouch = float(self.paddle2_last_touch[i])
+        game.paddle1.canMove = bool(self.paddle1_can_move[i])
+        game.paddle2.canMove = bool(self.paddle2_can_move[i])
+        game.paddle1.score = int(self.score1[i])
+        game.paddle2.score = int(self.score2[i])
+        game.pause = bool(self.pause[i])
+        game.goal1 = bool(self.goal1[i])
+        game.goal2 = bool(self.goal2[i])
+
+
+    def check_collision(self, paddle_x, paddle_y):
+        return ((self.ball_x - self.radius < paddle_x + self.paddle_width) &
+                (self.ball_x + self.radius > paddle_x) &
+                (self.ball_y - self.radius < paddle_y + self.paddle_height) &
+                (self.ball_y + self.radius > paddle_y))
+
+
+    def apply_new_velocity(self, mask, speed, goal_angle, arete):
+        # meme calcul que la fin de Ball.updateTrajectoryP1/P2
+        factor = speed * (1 + (1 - speed / self.max_speed))
+        x_vel = factor * np.cos(np.radians(goal_angle))
+        y_vel = factor * np.sin(np.radians(goal_angle))
+        x_vel = np.where(arete, x_vel * 2, x_vel)
+        y_vel = np.where(arete, y_vel * 2, y_vel)
+
+        boost = (np.abs(goal_angle) > 180 - 20) & (np.hypot(x_vel, y_vel) < self.max_speed)
+        x_vel = np.where(boost, x_vel * 1.2, x_vel)
+        y_vel = np.where(boost, y_vel * 1.2, y_vel)
+
+        # Ball recalcule la norme apres avoir deja modifie x_vel : on garde le meme ordre
+        too_fast = np.hypot(x_vel, y_vel) > self.max_speed
+        capped_x_vel = np.where(too_fast, x_vel / np.hypot(x_vel, y_vel) * self.max_speed, x_vel)
+        capped_y_vel = np.where(too_fast, y_vel / np.hypot(capped_x_vel, y_vel) * self.max_speed, y_vel)
+
+        self.ball_x_vel = np.where(mask, capped_x_vel, self.ball_x_vel)
+        self.ball_y_vel = np.where(mask, capped_y_vel, self.ball_y_vel)
+
+
+    def trajectory_inputs(self, paddle_y):
+        speed = np.hypot(self.ball_x_vel, self.ball_y_vel)
+        relative_impact = np.clip((self.ball_y - paddle_y) / self.paddle_height, 0, 1)
+        current_angle = np.degrees(np.arctan2(self.ball_y_vel, self.ball_x_vel))
+        natural_angle = np.degrees(np.arctan2(self.ball_y_vel, -self.ball_x_vel))
+        return speed, relative_impact, current_angle, natural_angle
+
+
+    def update_trajectory_p1(self, mask, now):
+        mask = mask & ~(self.paddle1_last_touch > now - 0.5)
+        if not mask.any():
+            return
+        self.paddle1_last_touch[mask] = now
+        speed, impact, current, natural = self.trajectory_inputs(self.paddle1_y)
+
+        arete = self.ball_x - self.radius / 2 < self.paddle1_x + self.paddle_width
+        straight = ~arete & ((current > 165) | (current < -165))
+        rising = ~arete & ~straight & (current < 0)
+        falling = ~arete & ~straight & ~rising
+        high = impact < 0.5
+
+        goal = np.where(self.ball_y > self.paddle1_y, 100.0, -100.0)
+        goal = np.where(straight, natural + 40 * (impact - 0.5), goal)
+        goal = np.where(rising & high, np.maximum(natural - 35 * (1 - impact), -50), goal)
+        goal = np.where(rising & ~high, natural + np.abs(natural) * impact, goal)
+        goal = np.where(falling & high, natural - np.abs(natural) * (1 - impact), goal)
+        low_falling = natural + 35 * impact
+        goal = np.where(falling & ~high, np.minimum(low_falling, 50), goal)
+
+        shift = np.where(rising & high, 10, 0) + np.where(falling & ~high, 10, 0) + np.where(falling & ~high & (low_falling > 50), 2, 0)
+        self.ball_x = np.where(mask, self.ball_x + shift, self.ball_x)
+        self.paddle1_can_move &= ~(mask & arete)
+        self.ball_last_touch[mask] = 1
+        self.apply_new_velocity(mask, speed, goal, arete)
+
+
+    def update_trajectory_p2(self, mask, now):
+        mask = mask & ~(self.paddle2_last_touch > now - 0.5)
+        if not mask.any():
+            return
+        self.paddle2_last_touch[mask] = now
+        speed, impact, current, natural = self.trajectory_inputs(self.paddle2_y)
+
+        arete = self.ball_x + self.radius / 2 > self.paddle2_x + self.paddle_width
+        straight = ~arete & (current < 15) & (current > -15)
+        rising = ~arete & ~straight & (current < 0)
+        falling = ~arete & ~straight & ~rising
+        high = impact < 0.5
+
+        goal = np.where(self.ball_y > self.paddle2_y, 80.0, -80.0)
+        goal = np.where(straight, natural - 35 * (impact - 0.5), goal)
+        goal = np.where(rising & high, np.minimum(natural + 35 * (1 - impact), -130), goal)
+        goal = np.where(rising & ~high, natural - (180 - np.abs(natural)) * impact, goal)
+        goal = np.where(falling & high, natural + (180 - np.abs(natural)) * (1 - impact), goal)
+        goal = np.where(falling & ~high, np.maximum(natural - 35 * (impact - 0.5), 130), goal)
+
+        self.paddle2_can_move &= ~(mask & arete)
+        self.ball_last_touch[mask] = 2
+        self.apply_new_velocity(mask, speed, goal, arete)
+
+
+    def step(self, now=None):
+        if now is None:
+            now = self.clock.now()
+        active = ~self.pause
+
+        # Game.move_paddles
+        self.integrate_paddles(self.tick_duration)
+
+        # Ball.move
+        self.ball_x = np.where(active, self.ball_x + self.ball_x_vel, self.ball_x)
+        self.ball_y = np.where(active, self.ball_y + self.ball_y_vel, self.ball_y)
+
+        # Ball.friction
+        slowed = active & (now - self.friction_timestamp > 0.4) & (np.hypot(self.ball_x_vel, self.ball_y_vel) > self.max_speed / 5)
+        self.friction_timestamp[slowed] = now
+        self.ball_x_vel = np.where(slowed, self.ball_x_vel * 0.93, self.ball_x_vel)
+        self.ball_y_vel = np.where(slowed, self.ball_y_vel * 0.93, self.ball_y_vel)
+
+        # Game.handle_collisions_on_paddle
+        self.update_trajectory_p1(active & self.check_collision(self.paddle1_x, self.paddle1_y), now)
+        self.update_trajectory_p2(active & self.check_collision(self.paddle2_x, self.paddle2_y), now)
+
+        # Game.handle_collisions_on_border
+        top = self.ball_y - self.radius <= 0
+        bottom = self.ball_y + self.radius >= self.height
+        bounced = active & (top | bottom)
+        self.touched_wall = np.where(bounced, np.where(top, 1, 2), self.touched_wall).astype(np.int8)
+        self.ball_y_vel = np.where(bounced, -self.ball_y_vel, self.ball_y_vel)
+
+        # Game.handle_scores
+        goal2 = active & (self.ball_x <= 0)
+        goal1 = active & (self.ball_x >= self.width)
+        scored = goal1 | goal2
+        self.goal1 |= goal1
+        self.goal2 |= goal2
+        self.score1 += goal1
+        self.score2 += goal2
+        self.paddle1_can_move |= scored
+        self.paddle2_can_move |= scored
+        self.pause |= scored
+
+        # un seul pas pour toutes les parties : l'horloge avance une fois par tick
+        self.tick += 1
+        self.clock.advance()
+
+
+    def set_actions(self, action1, action2):
+        # 1 monte, -1 descend, 0 ne bouge pas ; applique a chaque tick par step
+        self.action1[:] = action1
+        self.action2[:] = action2
+
+
+    def integrate_paddles(self, dt):
+        # Paddle.integrate
+        self.paddle1_y = self.integrate_paddle(self.paddle1_y, self.action1, dt)
+        self.paddle2_y = self.integrate_paddle(self.paddle2_y, self.action2, dt)
+
+
+    def integrate_paddle(self, paddle_y, action, dt):
+        shift = self.paddle_speed * dt
+        paddle_y = np.where(action == 1, np.maximum(0, paddle_y - shift), paddle_y)
+        return np.where(action == -1, np.minimum(self.height - self.paddle_height, paddle_y + shift), paddle_y)
+
+
+    def resume_on_goal(self):
+        # Game.resume_on_goal / Ball.reset pour toutes les parties ou un but a ete marque
+        scored = self.goal1 | self.goal2
+        if not scored.any():
+            return
+        count = self.count
+        right = self.rng.uniform(-30, 30, count)
+        left = np.where(self.rng.integers(1, 3, count) == 1, self.rng.uniform(-180, -150, count), self.rng.uniform(150, 180, count))
+        angle = np.radians(np.where(self.ball_x > 0, right, left))
+        speed = self.max_speed / 3.5
+
+        self.ball_x = np.where(scored, self.width // 2, self.ball_x)
+        self.ball_y = np.where(scored, self.height // 2, self.ball_y)
+        self.ball_x_vel = np.where(scored, speed * np.cos(angle), self.ball_x_vel)
+        self.ball_y_vel = np.where(scored, speed * np.sin(angle), self.ball_y_vel)
+        self.goal1 &= ~scored
+        self.goal2 &= ~scored
+        self.pause &= ~scored
+
+
+    def isgameover(self):
+        return (self.score1 >= self.scoreLimit) | (self.score2 >= self.scoreLimit)
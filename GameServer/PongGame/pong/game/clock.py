@@ -0,0 +1,55 @@
+import time
+
+
+# Horloges utilisables par Game : toutes les regles physiques (frottement,
+# anti-rebond des raquettes...) lisent le temps via clock.now().
+# clock.advance() est appele une fois par tick par ce qui fait avancer les parties :
+# Game.advance seulement si la partie est proprietaire de l'horloge (owner, la premiere
+# partie qui la recoit), step_all (simulation) ou BatchGame.step pour une horloge partagee.
+# Game.step seul ne la fait pas avancer.
+
+class RealClock:
+    owner = None
+
+    def now(self):
+        return time.time()
+
+    def advance(self):
+        pass
+
+
+class TickClock:
+    # le temps avance d'un tick a chaque pas de physique, quel que soit le temps reel ;
+    # sans tick_rate, la cadence est le physics_rate de la premiere partie qui la recoit
+    owner = None
+
+    def __init__(self, tick_rate=None, start=0.0):
+        self.tick_rate = tick_rate
+        self.start = start
+        self.ticks = 0
+
+    def now(self):
+        return self.start + self.ticks / self.tick_rate
+
+    def advance(self):
+        self.ticks += 1
+
+
+class ManualClock:
+    # le temps ne bouge que lorsqu'on le fixe explicitement
+    owner = None
+
+    def __init__(self, start=0.0):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def set(self, value):
+        self.current = value
+
+    def forward(self, seconds):
+        self.current += seconds
+
+    def advance(self):
+        pass
@@ -0,0 +1,237 @@
+import json
+import struct
+
+
+# suffixes JSON pre-encodes pour le champ "side", propre a chaque client
+SIDE_SUFFIXES = {side: ', "side": ' + json.dumps(side) + '}' for side in ("p1", "p2", None)}
+
+# Sous-protocole websocket optionnel : le client l'ajoute apres "token_<jwt>" et
+# recoit alors les etats en binaire (les messages de controle restent en JSON).
+BINARY_SUBPROTOCOL = "pong.binary.v3"
+BINARY_VERSION = 3
+
+# version, tick, balle x/y/vitesse/angle, raquettes y, prochaine collision (balle puis ai_data),
+# scores, scoreLimit, mode, derniere sequence d'entree de chaque joueur, cases entieres de ai_data
+# et rounded_angle en demi-radians ; les flags (H) sont ajoutes par client
+BINARY_BODY = struct.Struct("<BIffffffbfbfBBBBHHbbbbb")
+BINARY_FLAGS = struct.Struct("<H")
+
+GAME_MODES = {None: 0, "PVP_keyboard": 1, "PVP_LAN": 2, "PVE": 3}
+
+FLAG_PLAYING = 1 << 0
+FLAG_PAUSE = 1 << 1
+FLAG_RESUME_ON_GOAL = 1 << 2
+FLAG_GAMEOVER = 1 << 3
+FLAG_GOAL_1 = 1 << 4
+FLAG_GOAL_2 = 1 << 5
+FLAG_WINNER_1 = 1 << 6
+FLAG_WINNER_2 = 1 << 7
+FLAG_SIDE_P1 = 1 << 8
+FLAG_SIDE_P2 = 1 << 9
+FLAG_WALL_TOP = 1 << 10
+FLAG_WALL_BOTTOM = 1 << 11
+FLAG_TOUCH_1 = 1 << 12
+FLAG_TOUCH_2 = 1 << 13
+FLAG_SEQUENCE_1 = 1 << 14
+FLAG_SEQUENCE_2 = 1 << 15
+
+SIDE_FLAGS = {"p1": FLAG_SIDE_P1, "p2": FLAG_SIDE_P2}
+
+# Entrees compactes recues en binaire, quel que soit le sous-protocole : joueur
+# (1, 2, ou 0 pour le cote du client), direction (1 monte, -1 descend, 0 stop)
+# et numero de sequence sur 16 bits. Les messages de controle restent en JSON.
+INPUT_MESSAGE = struct.Struct("<BbH")
+# meme message suivi du tick vise (uint32), pour les clients qui predisent
+INPUT_MESSAGE_TICK = struct.Struct("<BbHI")
+
+
+# Etat d'une partie a un tick donne. Le corps commun est encode une seule fois,
+# puis chaque client recoit ce corps suivi de son suffixe "side".
+class StateFrame:
+
+    def __init__(self, tick, state: dict, angle=0.0):
+        self.tick = tick
+        self.state = state
+        # angle brut de la balle, les champs JSON n'en gardent qu'une version arrondie
+        self.angle = angle
+        self._body = None
+        self._binary_body = None
+        self._binary_flags = None
+
+    def body(self):
+        if self._body is None:
+            # on retire l'accolade fermante pour pouvoir ajouter le suffixe du client
+            self._body = json.dumps(self.state)[:-1]
+        return self._body
+
+    def encode(self, side=None):
+        return with_side(self.body(), side)
+
+    def binary_body(self):
+        if self._binary_body is None:
+            state = self.state
+            ball = state["ball"]
+            game = state["game"]
+            ai_collision = game["ai_data"][4]
+            self._binary_body = BINARY_BODY.pack(
+                BINARY_VERSION,
+                self.tick,
+                ball["x"], ball["y"], ball["speed"], self.angle,
+                state["paddle1"]["y"], state["paddle2"]["y"],
+                ball["next_collision"][0], ball["next_collision"][1],
+                ai_collision[0], ai_collision[1],
+                state["paddle1"]["score"], state["paddle2"]["score"], game["scoreLimit"],
+                GAME_MODES.get(state.get("game_mode"), 0),
+                state["paddle1"]["sequence"] or 0, state["paddle2"]["sequence"] or 0,
+                # valeurs discretes recopiees telles quelles : les float32 peuvent changer de case
+                game["ai_data"][0], game["ai_data"][1], round(game["ai_data"][2] * 10), game["ai_data"][3],
+                round(ball["rounded_angle"] * 2),
+            )
+            self._binary_flags = self.flags()
+        return self._binary_body
+
+    def flags(self):
+        state = self.state
+        ball = state["ball"]
+        flags = 0
+        if state["playing"]:
+            flags |= FLAG_PLAYING
+        if state["game"]["pause"]:
+            flags |= FLAG_PAUSE
+        if state.get("resumeOnGoal"):
+            flags |= FLAG_RESUME_ON_GOAL
+        if state["gameover"] == "Score":
+            flags |= FLAG_GAMEOVER
+        if state["goal"] == "1":
+            flags |= FLAG_GOAL_1
+        elif state["goal"] == "2":
+            flags |= FLAG_GOAL_2
+        if state["winner"] == "1":
+            flags |= FLAG_WINNER_1
+        elif state["winner"] == "2":
+            flags |= FLAG_WINNER_2
+        if ball["touchedWall"] == "top":
+            flags |= FLAG_WALL_TOP
+        elif ball["touchedWall"] == "bottom":
+            flags |= FLAG_WALL_BOTTOM
+        if ball["lastTouch"] == "1":
+            flags |= FLAG_TOUCH_1
+        elif ball["lastTouch"] == "2":
+            flags |= FLAG_TOUCH_2
+        if state["paddle1"]["sequence"] is not None:
+            flags |= FLAG_SEQUENCE_1
+        if state["paddle2"]["sequence"] is not None:
+            flags |= FLAG_SEQUENCE_2
+        return flags
+
+    def encode_binary(self, side=None):
+        body = self.binary_body()
+        return with_side_flags(body, self._binary_flags, side)
+
+
+def with_side(body, side):
+    suffix = SIDE_SUFFIXES.get(side)
+    if suffix is None:
+        suffix = ', "side": ' + json.dumps(side) + '}'
+    return body + suffix
+
+
+def with_side_flags(binary_body, flags, side):
+    return binary_body + BINARY_FLAGS.pack(flags | SIDE_FLAGS.get(side, 0))
+
+
+# Sous-protocole optionnel pour les etats JSON compresses : une image complete
+# ("frame": "key") regulierement et apres chaque but, puis seulement les champs
+# qui different de cette image ("frame": "delta").
+DELTA_SUBPROTOCOL = "pong.delta.v1"
+
+# Sous-protocole des spectateurs : lecture seule, pas de place de joueur
+SPECTATOR_SUBPROTOCOL = "pong.spectator.v1"
+
+
+def diff_state(base: dict, state: dict) -> dict:
+    changes = {}
+    for key, value in state.items():
+        previous = base.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff_state(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in base or previous != value:
+            changes[key] = value
+    return changes
+
+
+class DeltaEncoder:
+
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.keyframe = None
+        # numero de l'image de reference, les deltas indiquent celle sur laquelle ils s'appliquent
+        self.keyframe_id = 0
+        self.keyframe_frame = None
+        self.frames_since_keyframe = 0
+
+    def needs_keyframe(self, state):
+        if self.keyframe is None or self.frames_since_keyframe >= self.keyframe_interval:
+            return True
+        # but, fin de partie : on repart d'une image complete
+        return any(state.get(key) != self.keyframe.get(key) for key in ("goal", "gameover", "winner"))
+
+    def encode(self, frame: StateFrame) -> StateFrame:
+        state = frame.state
+        if self.needs_keyframe(state):
+            self.keyframe = state
+            self.keyframe_id += 1
+            self.keyframe_frame = StateFrame(frame.tick, dict(state, frame="key", tick=frame.tick, key=self.keyframe_id))
+            self.frames_since_keyframe = 0
+            return self.keyframe_frame
+
+        self.frames_since_keyframe += 1
+        return StateFrame(frame.tick, {
+            "type": state["type"],
+            "frame": "delta",
+            "tick": frame.tick,
+            "key": self.keyframe_id,
+            "changes": diff_state(self.keyframe, state),
+        })
+
+
+# Message de groupe du channel layer portant une frame : seuls les encodages demandes
+# par les clients connectes sont calcules, chaque consumer ajoute ensuite son "side".
+# Uniquement des str/bytes/int pour passer par un backend Redis.
+def frame_event(frame: StateFrame, formats, delta_encoder: DeltaEncoder = None) -> dict:
+    event = {
+        "type": "state.frame",
+        "json": None,
+        "binary": None,
+        "flags": 0,
+        "delta": None,
+        "keyframe": None,
+        "key": None,
+        # change quand la partie change d'etat : ces frames ne sont jamais jetees en file d'envoi
+        "marker": f"{frame.state.get('goal')}:{frame.state.get('gameover')}:{frame.state.get('resumeOnGoal')}",
+    }
+    if "json" in formats:
+        event["json"] = frame.body()
+    if "binary" in formats:
+        event["binary"] = frame.binary_body()
+        event["flags"] = frame._binary_flags
+    if "delta" in formats and delta_encoder is not None:
+        delta_frame = delta_encoder.encode(frame)
+        event["keyframe"] = delta_encoder.keyframe_frame.body()
+        event["key"] = delta_encoder.keyframe_id
+        if delta_frame is not delta_encoder.keyframe_frame:
+            event["delta"] = delta_frame.body()
+    return event
+
+
+# Frame des spectateurs, construite a partir du message des joueurs : le "side" est
+# deja ajoute, tous les spectateurs recoivent exactement les memes octets.
+def spectator_event(event: dict) -> dict:
+    return {
+        "type": "spectator.frame",
+        "text": None if event["json"] is None else with_side(event["json"], "spectator"),
+        "bytes": None if event["binary"] is None else with_side_flags(event["binary"], event["flags"], "spectator"),
+        "marker": event["marker"],
+    }
@@ -2,23 +2,32 @@ import logging
 
 from .paddle import Paddle
 from .ball import Ball
+from .clock import RealClock, TickClock
+from .frame import StateFrame
 import math
 import time
-import json
 import random
 import asyncio
 
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, physics_rate=1000, frame_rate=60, clock=None, rng=None):
+        # horloge lue par toutes les regles physiques (RealClock, TickClock ou ManualClock)
+        self.clock = clock if clock is not None else RealClock()
+        if isinstance(self.clock, TickClock) and self.clock.tick_rate is None:
+            self.clock.tick_rate = physics_rate
+        # seule la premiere partie qui recoit l'horloge la fait avancer dans advance()
+        if self.clock.owner is None:
+            self.clock.owner = self
+        self.rng = rng if rng is not None else random
         self.width = 1500
         self.height = 1000
         self.white = (255, 255, 255)
         self.black = (0, 0, 0)
 
         # Init objects
-        self.ball: Ball = Ball(self.width // 2, self.height // 2, self.height // 100, self.width, self.height)
+        self.ball: Ball = Ball(self.width // 2, self.height // 2, self.height // 100, self.width, self.height, self.clock, self.rng)
         self.paddle1: Paddle = Paddle(self.width // 30, self.height // 2 - (self.height // 6 // 2), self.height // 150, self.height // 6, self.width, self.height)
         self.paddle2: Paddle = Paddle(self.width - self.width // 30, self.height // 2 - (self.height // 6 // 2), self.height // 150, self.height // 6, self.width, self.height)
 
@@ -34,7 +43,7 @@ class Game:
         self.pause = False
         self.goal1 = False
         self.goal2 = False
-        self.currentTs = time.time()
+        self.currentTs = self.clock.now()
         self.NewCalculusNeeded = True
         self.pauseCoolDown = self.currentTs
         self.lastSentInfos = 0
@@ -47,7 +56,13 @@ class Game:
         # self.paddle1.vel *= self.speed_multiplier
         # self.paddle2.vel *= self.speed_multiplier
 
-        self.frame_rate = 60
+        # la physique avance a pas fixe (physics_rate ticks par seconde),
+        # independamment de la frequence d'envoi des etats (frame_rate)
+        self.physics_rate = physics_rate
+        self.frame_rate = frame_rate
+        self.tick = 0
+        self.accumulator = 0
+        self.max_frame_delay = 0.25
 
 
     def handle_collisions_on_paddle(self):
@@ -66,7 +81,7 @@ class Game:
                 self.ball.touchedWall = "top"
             else:
                 self.ball.touchedWall = "bottom"
-            self.ball.y_vel = -self.ball.y_vel
+            self.ball.bounceOnWall()
 
 
     def handle_scores(self):
@@ -89,43 +104,99 @@ class Game:
             self.last_frame_time = 0
 
 
-    async def rungame(self):
+    def update_next_collision(self):
         ball = self.ball
         paddle1 = self.paddle1
         paddle2 = self.paddle2
 
+        if ball.x_vel < 0:
+            self.nextCollision = ball.predictNextCollision(paddle1)
+        else:
+            self.nextCollision = ball.predictNextCollision(paddle2)
+        if self.TRAININGPARTNER is True:
+            half_height = paddle2.height // 2
+            if self.partner_side == "right":
+                paddle2.y = self.nextCollision[1] + self.rng.uniform(-half_height, half_height) - half_height
+            else:
+                paddle1.y = self.nextCollision[1] + self.rng.uniform(-half_height, half_height) - half_height
+        self.NewCalculusNeeded = False
+
+
+    def apply_inputs(self, flush=False):
+        self.paddle1.apply_inputs(self.tick, flush)
+        self.paddle2.apply_inputs(self.tick, flush)
+
+
+    def move_paddles(self, dt):
+        self.paddle1.integrate(dt, self.height)
+        self.paddle2.integrate(dt, self.height)
+
+
+    def step(self):
+        ball = self.ball
+
+        if self.NewCalculusNeeded == True:
+            self.update_next_collision()
+
+        # entrees visant ce tick, puis les raquettes bougent avant la balle
+        # pour que les collisions voient leur position du tick
+        self.apply_inputs()
+        self.move_paddles(1 / self.physics_rate)
+
+        if not self.pause:
+
+            ball.move()
+            ball.friction()
+            self.handle_collisions_on_paddle()
+            self.handle_collisions_on_border()
+            self.handle_scores()
+
+        self.tick += 1
+
+
+    def advance(self, elapsed):
+        # on borne le retard pour ne pas rattraper indefiniment apres un blocage de la boucle
+        self.accumulator = min(self.accumulator + elapsed, self.max_frame_delay)
+        tick_duration = 1 / self.physics_rate
+
+        if self.pause:
+            # pas de tick pendant la pause, mais les joueurs peuvent toujours se replacer
+            self.apply_inputs(flush=True)
+            self.move_paddles(min(elapsed, self.max_frame_delay))
+            self.accumulator = 0
+        while self.accumulator >= tick_duration:
+            self.step()
+            # une horloge partagee n'avance qu'une fois par tick, par sa partie proprietaire,
+            # step_all ou BatchGame
+            if self.clock.owner is self:
+                self.clock.advance()
+            self.accumulator -= tick_duration
+            if self.pause:
+                self.accumulator = 0
+
+        if self.NewCalculusNeeded == True:
+            self.update_next_collision()
+
+
+    def frame(self):
+        self.serialize()
+        return StateFrame(self.tick, dict(self.gameState), math.atan2(self.ball.y_vel, self.ball.x_vel))
+
+
+    async def rungame(self):
+        frame_duration = 1 / self.frame_rate
+        previous_time = time.monotonic()
+
         while self.run:
-            current_time = time.time()
-
-            if self.NewCalculusNeeded == True:
-                if ball.x_vel < 0:
-                    self.nextCollision = ball.calculateNextCollisionPosition(paddle1)
-                else:
-                    self.nextCollision = ball.calculateNextCollisionPosition(paddle2)
-                if self.TRAININGPARTNER is True:
-                    half_height = paddle2.height // 2
-                    if self.partner_side == "right":
-                        paddle2.y = self.nextCollision[1] + random.uniform(-half_height, half_height) - half_height
-                    else:
-                        paddle1.y = self.nextCollision[1] + random.uniform(-half_height, half_height) - half_height
-                self.NewCalculusNeeded = False
-
-            await asyncio.sleep(0.001)  
-
-            if not self.pause:
-
-                ball.move()
-                ball.friction()
-                self.handle_collisions_on_paddle()
-                self.handle_collisions_on_border()
-                self.handle_scores()
+            current_time = time.monotonic()
+            self.advance(current_time - previous_time)
+            previous_time = current_time
 
             # send JSON game state
-            if current_time - self.last_frame_time >= 1/self.frame_rate or self.isgameover() == True:
-                self.serialize()
-                self.last_frame_time = current_time
+            self.last_frame_time = current_time
+            yield self.frame()
 
-                yield json.dumps(self.gameState)
+            await asyncio.sleep(max(0, current_time + frame_duration - time.monotonic()))
 
 
     def resetPaddles(self):
@@ -186,11 +257,15 @@ class Game:
 
 
     async def resume_on_goal(self):
+        self.resume_point()
+
+
+    def resume_point(self):
         if self.goal1 == False and self.goal2 == False:
             return
         self.ball.reset(self.ball.x)
         self.goal1 = False
         self.goal2 = False
-        self.lastSentInfos = time.time() - 0.25
+        self.lastSentInfos = self.clock.now() - 0.25
         self.pause = False
     
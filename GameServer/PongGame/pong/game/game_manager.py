@@ -1,14 +1,273 @@
 import asyncio
+import os
+import sys
+import time
+import types
+from collections import deque
 from typing import Optional
 from .game_wrapper import GameWrapper
 from _datetime import datetime
 from .game_status import GameStatus
+from .game_scheduler import GameScheduler
+from .game_tasks import GameTasks
+from .snapshot import snapshot_game, restore_game, encode_snapshot, decode_snapshot
+from ..game_shard import local_shard, shard_of, with_shard
+from ..http_client import internal_http
 import logging
 
+# duree maximale (secondes) d'une partie dans chaque statut avant que le reaper la retire
+GAME_TTL = {
+    GameStatus.WAITING: 120,       # second joueur jamais arrive (les tickets expirent apres 120s)
+    GameStatus.STARTING: 60,
+    GameStatus.IN_PROGRESS: 3600,
+    GameStatus.PAUSED: 60,         # coupure ou migration sans retour des joueurs
+    GameStatus.FINISHED: 30,
+    GameStatus.CANCELLED: 30,
+}
+# partie sans aucun client connecte (hors coupure en cours)
+ORPHAN_TTL = 30
+REAP_INTERVAL = 15
+# intervalle minimal (secondes) entre deux lignes de stats du processus, ecrites par le reaper
+STATS_INTERVAL = int(os.getenv('GAME_STATS_INTERVAL', '60'))
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    # estimation de la memoire d'une partie : objets, dicts, listes et deques references
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, (type, types.ModuleType, types.FunctionType,
+                                                           types.MethodType, asyncio.AbstractEventLoop)):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
 class GameManager:
     def __init__(self):
         self.active_games = {}
         self._lock = asyncio.Lock()
+        self.scheduler = GameScheduler()
+        # shard de ce processus (GAME_SHARD_ID) : il n'heberge que les parties dont l'uid le designe
+        self.shard_id = local_shard()
+        # appels internes au matchmaking (renommage des parties migrees)
+        self.http = internal_http
+
+        self._listener = None
+        self.migrated = 0
+        # reconnexions apres coupure : duree de la poignee de main et temps passe hors ligne
+        self.rejoins = 0
+        self.rejoin_handshake_total = 0.0
+        self.rejoin_handshake_max = 0.0
+        self.rejoin_offline_max = 0.0
+        # lancement des parties : arrivee du second joueur -> premiere frame
+        self.lobbies = 0
+        self.lobby_start_total = 0.0
+        self.lobby_start_max = 0.0
+
+        self._reaper = None
+        self.reaped = 0
+        self.reaped_by_status = {}
+
+    def owns(self, game_id: str) -> bool:
+        return shard_of(game_id) == self.shard_id
+
+    def record_rejoin(self, handshake: float, offline: float):
+        self.rejoins += 1
+        self.rejoin_handshake_total += handshake
+        self.rejoin_handshake_max = max(self.rejoin_handshake_max, handshake)
+        self.rejoin_offline_max = max(self.rejoin_offline_max, offline)
+        logging.info(f"player rejoined after {offline:.2f}s offline, handshake {handshake * 1000:.1f}ms")
+
+    def rejoin_stats(self):
+        return {
+            "rejoins": self.rejoins,
+            "avg_handshake_ms": round(1000 * self.rejoin_handshake_total / self.rejoins, 2) if self.rejoins else 0.0,
+            "max_handshake_ms": round(1000 * self.rejoin_handshake_max, 2),
+            "max_offline_s": round(self.rejoin_offline_max, 2),
+        }
+
+    def record_lobby(self, lobby):
+        latency = lobby.start_latency()
+        if latency is None:
+            return
+        self.lobbies += 1
+        self.lobby_start_total += latency
+        self.lobby_start_max = max(self.lobby_start_max, latency)
+        logging.info(f"game started {latency * 1000:.0f}ms after the second player joined: {lobby.timings()}")
+
+    def lobby_stats(self):
+        return {
+            "games": self.lobbies,
+            "avg_start_ms": round(1000 * self.lobby_start_total / self.lobbies, 2) if self.lobbies else 0.0,
+            "max_start_ms": round(1000 * self.lobby_start_max, 2),
+        }
+
+    def shard_channel(self, shard: int) -> str:
+        return f"pong_shard_{shard}"
+
+    def import_channel(self, game_id: str) -> str:
+        return f"pong_import_{game_id}"
+
+    def export_game(self, game_id: str):
+        wrapper = self.active_games.get(game_id)
+        if wrapper is None:
+            return None
+        return encode_snapshot(snapshot_game(wrapper))
+
+    async def import_game(self, payload: bytes, game_id: str = None) -> GameWrapper:
+        wrapper = restore_game(decode_snapshot(payload), game_id)
+        async with self._lock:
+            self.active_games[wrapper.game_id] = wrapper
+        return wrapper
+
+    async def receive_migrated_game(self, game_id: str, channel_layer, timeout=1.0):
+        # premier client reconnecte : le snapshot attend dans le canal de la partie.
+        # Le verrou n'est pas garde pendant l'attente, les autres parties du shard continuent.
+        async with self._lock:
+            if game_id in self.active_games:
+                return self.active_games[game_id]
+        try:
+            message = await asyncio.wait_for(channel_layer.receive(self.import_channel(game_id)), timeout)
+        except asyncio.TimeoutError:
+            return self.active_games.get(game_id)
+        wrapper = restore_game(decode_snapshot(message["snapshot"]), game_id)
+        async with self._lock:
+            # un autre client a pu importer la partie pendant l'attente
+            return self.active_games.setdefault(game_id, wrapper)
+
+    async def migrate_game(self, game_id: str, shard: int, channel_layer):
+        # la physique s'arrete, le snapshot part vers le shard cible et les clients sont
+        # rediriges vers le nouvel uid ; la partie disparait de ce processus
+        wrapper = self.active_games.get(game_id)
+        if wrapper is None or shard == self.shard_id:
+            return None
+        new_id = with_shard(game_id, shard)
+        self.scheduler.unregister(game_id)
+        payload = encode_snapshot(snapshot_game(wrapper))
+        await channel_layer.send(self.import_channel(new_id), {"type": "game.import", "snapshot": payload})
+        # avant la redirection : les clients reconnectes verifient et nettoient la partie sous son nouvel uid
+        await self.rename_in_matchmaking(game_id, new_id)
+        await channel_layer.group_send(f"pong_{game_id}", {"type": "game.redirect", "uid": new_id})
+        await channel_layer.group_send(f"pong_{game_id}_spectators", {"type": "game.redirect", "uid": new_id})
+        async with self._lock:
+            self.active_games.pop(game_id, None)
+        wrapper.tasks.close()
+        self.migrated += 1
+        logging.warning(f"game {game_id} migrated to shard {shard} as {new_id} ({len(payload)} bytes)")
+        return new_id
+
+    async def rename_in_matchmaking(self, game_id: str, new_id: str) -> bool:
+        headers = {
+            'Content-Type': 'application/json',
+            "Authorization": f"{os.getenv('GAME_SERVICE_TOKEN')}",
+        }
+        try:
+            status, response_text = await self.http.request(
+                "POST", "rename", f"/game/rename/{game_id}/", json={"uid": new_id}, headers=headers)
+        except Exception as e:
+            logging.error(f"Rename request error for {game_id}: {str(e)}")
+            return False
+        if status != 200:
+            logging.error(f"Rename of {game_id} to {new_id} failed: {status}")
+            logging.error(f"Response: {response_text}")
+            return False
+        return True
+
+    def ensure_listener(self, channel_layer):
+        # ordres de migration envoyes a ce shard (commande migrate_games)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.ensure_future(self.listen(channel_layer))
+
+    async def listen(self, channel_layer):
+        while True:
+            message = await channel_layer.receive(self.shard_channel(self.shard_id))
+            if message.get("type") != "game.migrate":
+                continue
+            game_ids = [message["game_id"]] if message.get("game_id") else list(self.active_games)
+            for game_id in game_ids:
+                try:
+                    await self.migrate_game(game_id, message["shard"], channel_layer)
+                except Exception as e:
+                    logging.error(f"Error migrating game {game_id}: {str(e)}")
+
+    def ensure_reaper(self, channel_layer):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self.reap_loop(channel_layer))
+
+    async def reap_loop(self, channel_layer):
+        last_stats = time.monotonic()
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            try:
+                await self.reap(channel_layer)
+                if time.monotonic() - last_stats >= STATS_INTERVAL:
+                    last_stats = time.monotonic()
+                    self.log_stats()
+            except Exception as e:
+                logging.error(f"Error in game reaper: {str(e)}")
+
+    def is_expired(self, wrapper: GameWrapper, now: float) -> bool:
+        if now - wrapper.status_since > GAME_TTL[wrapper.status]:
+            return True
+        # une coupure en cours garde la partie sans client, sa duree est bornee par PAUSED
+        if wrapper.connections or wrapper.status == GameStatus.PAUSED:
+            wrapper.orphan_since = None
+            return False
+        if wrapper.orphan_since is None:
+            wrapper.orphan_since = now
+        return now - wrapper.orphan_since > ORPHAN_TTL
+
+    async def reap(self, channel_layer, now: float = None) -> list:
+        # retire les parties abandonnees : boucle d'etats arretee, clients fermes, entree liberee
+        now = time.monotonic() if now is None else now
+        async with self._lock:
+            expired = [wrapper for wrapper in self.active_games.values() if self.is_expired(wrapper, now)]
+            for wrapper in expired:
+                self.active_games.pop(wrapper.game_id, None)
+                self.scheduler.unregister(wrapper.game_id)
+        for wrapper in expired:
+            status = wrapper.status
+            self.reaped += 1
+            self.reaped_by_status[str(status)] = self.reaped_by_status.get(str(status), 0) + 1
+            wrapper.game.pause = True
+            wrapper.game_over.set()
+            wrapper.set_status(GameStatus.CANCELLED)
+            wrapper.tasks.close()
+            logging.warning(f"reaped game {wrapper.game_id} ({status}, created {wrapper.created_at:%H:%M:%S}, "
+                            f"{len(wrapper.connections)} clients)")
+            if wrapper.connections:
+                await channel_layer.group_send(f"pong_{wrapper.game_id}", {"type": "game.expired"})
+            if wrapper.spectators:
+                await channel_layer.group_send(f"pong_{wrapper.game_id}_spectators", {"type": "game.expired"})
+        return [wrapper.game_id for wrapper in expired]
+
+    def reaper_stats(self):
+        sizes = [deep_sizeof(wrapper) for wrapper in list(self.active_games.values())]
+        return {
+            "active": len(sizes),
+            "reaped": self.reaped,
+            "reaped_by_status": dict(self.reaped_by_status),
+            "avg_bytes_per_game": sum(sizes) // len(sizes) if sizes else 0,
+            "max_bytes_per_game": max(sizes, default=0),
+        }
+
+    def stats(self):
+        return {"reaper": self.reaper_stats(), "tasks": self.task_stats(), "lobby": self.lobby_stats()}
+
+    def log_stats(self):
+        logging.info(f"game server stats: {self.stats()}")
+
+    def task_stats(self):
+        # taches en cours des parties actives, compteurs cumules depuis le lancement du processus
+        running = sum(len(wrapper.tasks.tasks) for wrapper in list(self.active_games.values()))
+        return {"running": running, **GameTasks.totals}
 
     async def create_or_get_game(self, game_id: str) -> GameWrapper:
         async with self._lock:
@@ -24,10 +283,12 @@ class GameManager:
         
     async def remove_game(self, game_id: str):
         async with self._lock:
-            if game_id in self.active_games:
-                del self.active_games[game_id]
-                return True
-            return False
+            self.scheduler.unregister(game_id)
+            wrapper = self.active_games.pop(game_id, None)
+            if wrapper is None:
+                return False
+            wrapper.tasks.close()
+            return True
 
 # Instance unique
 game_manager = GameManager()
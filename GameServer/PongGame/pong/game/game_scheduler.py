@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+
+# Fait avancer toutes les parties actives depuis une seule boucle : a chaque tick,
+# la physique de chaque partie est mise a jour puis son etat est depose dans la
+# file de la partie, lue par son consumer.
+class GameScheduler:
+
+    def __init__(self, frame_rate=60):
+        self.frame_rate = frame_rate
+        self.games = {}
+        # attentes en ticks (compte a rebours du lobby) : (tick cible, future)
+        self.timers = []
+        self._task = None
+
+        # statistiques
+        self.ticks = 0
+        self.overruns = 0
+        self.last_tick_duration = 0
+        self.max_tick_duration = 0
+
+    def register(self, game_id: str, game) -> asyncio.Queue:
+        # une seule frame en attente par partie : si le consumer est en retard, on garde la plus recente
+        queue = asyncio.Queue(maxsize=1)
+        self.games[game_id] = (game, queue)
+        self._ensure_running()
+        return queue
+
+    def wait_ticks(self, ticks: int) -> asyncio.Future:
+        # resolue apres `ticks` ticks de la boucle, au rythme des frames
+        future = asyncio.get_running_loop().create_future()
+        self.timers.append((self.ticks + ticks, future))
+        self._ensure_running()
+        return future
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    def unregister(self, game_id: str):
+        entry = self.games.pop(game_id, None)
+        if entry is not None:
+            # None reveille le consumer qui attend la prochaine frame : la partie ne tourne plus ici
+            self.dispatch(entry[1], None)
+
+    def dispatch(self, queue: asyncio.Queue, frame):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(frame)
+
+    def tick(self, elapsed):
+        for game_id, (game, queue) in list(self.games.items()):
+            try:
+                if not game.run:
+                    self.unregister(game_id)
+                    continue
+                game.advance(elapsed)
+                self.dispatch(queue, game.frame())
+            except Exception as e:
+                logging.error(f"Error while stepping game {game_id}: {str(e)}")
+                self.unregister(game_id)
+        self.ticks += 1
+        if self.timers:
+            self.fire_timers()
+
+    def fire_timers(self):
+        pending = []
+        for target, future in self.timers:
+            if future.done():
+                continue
+            if target <= self.ticks:
+                future.set_result(self.ticks)
+            else:
+                pending.append((target, future))
+        self.timers = pending
+
+    async def run(self):
+        frame_duration = 1 / self.frame_rate
+        previous_time = time.monotonic()
+        next_tick = previous_time
+
+        while self.games or self.timers:
+            current_time = time.monotonic()
+            self.tick(current_time - previous_time)
+            previous_time = current_time
+
+            self.last_tick_duration = time.monotonic() - current_time
+            self.max_tick_duration = max(self.max_tick_duration, self.last_tick_duration)
+            if self.last_tick_duration > frame_duration:
+                self.overruns += 1
+                logging.warning(f"Scheduler tick over budget: {self.last_tick_duration * 1000:.2f}ms "
+                                f"for {len(self.games)} games (budget {frame_duration * 1000:.2f}ms)")
+
+            next_tick += frame_duration
+            if next_tick < time.monotonic():
+                # en retard : on repart du temps courant plutot que d'enchainer les ticks
+                next_tick = time.monotonic()
+            await asyncio.sleep(next_tick - time.monotonic())
+
+    def stats(self):
+        return {
+            "games": len(self.games),
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "last_tick_duration": self.last_tick_duration,
+            "max_tick_duration": self.max_tick_duration,
+        }
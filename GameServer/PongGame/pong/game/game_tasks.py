@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+
+# delai laisse aux taches annulees pour se terminer avant d'etre comptees comme fuites (secondes)
+LEAK_CHECK_DELAY = 1.0
+
+
+# Coroutines d'une partie (boucle des etats, attentes du lobby, writers des clients...).
+# Chaque tache est rattachee a un proprietaire : le nom de canal du client qui l'a lancee,
+# ou None pour la partie elle-meme. cancel(owner) arrete celles d'un client qui se
+# deconnecte, close() toutes celles de la partie quand elle est retiree du processus.
+# La tache courante n'est jamais annulee : un disconnect appele depuis une de ces
+# coroutines doit pouvoir aller au bout.
+class GameTasks:
+
+    # compteurs cumules sur toutes les parties du processus
+    totals = {"spawned": 0, "cancelled": 0, "failed": 0, "leaked": 0}
+
+    def __init__(self, game_id: str):
+        self.game_id = game_id
+        # tache -> proprietaire
+        self.tasks = {}
+        self.spawned = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.leaked = 0
+        self.closed = False
+
+    def spawn(self, coro, name: str, owner: str = None):
+        if self.closed:
+            # partie deja retiree : la coroutine ne doit pas lui survivre
+            coro.close()
+            self._count("leaked")
+            logging.warning(f"task {self.game_id}:{name} started after the game was removed")
+            return None
+        task = asyncio.ensure_future(coro)
+        task.set_name(f"{self.game_id}:{name}")
+        self.tasks[task] = owner
+        self._count("spawned")
+        task.add_done_callback(self._done)
+        return task
+
+    def _count(self, field, n=1):
+        setattr(self, field, getattr(self, field) + n)
+        GameTasks.totals[field] += n
+
+    def _done(self, task):
+        self.tasks.pop(task, None)
+        if task.cancelled():
+            self._count("cancelled")
+            return
+        error = task.exception()
+        if error is not None:
+            self._count("failed")
+            logging.error(f"task {task.get_name()} failed: {error!r}")
+
+    def cancel(self, owner: str = None) -> list:
+        current = asyncio.current_task()
+        tasks = [task for task, task_owner in list(self.tasks.items())
+                 if owner is None or task_owner == owner]
+        for task in tasks:
+            if task is not current:
+                task.cancel()
+        return tasks
+
+    def close(self):
+        # partie retiree : tout est annule, ce qui tourne encore apres LEAK_CHECK_DELAY est une fuite
+        if self.closed:
+            return
+        self.closed = True
+        tasks = self.cancel()
+        if tasks:
+            asyncio.get_running_loop().call_later(LEAK_CHECK_DELAY, self._check_leaks, tasks)
+
+    def _check_leaks(self, tasks):
+        leaked = [task.get_name() for task in tasks if not task.done()]
+        if leaked:
+            self._count("leaked", len(leaked))
+            logging.warning(f"game {self.game_id} removed but {len(leaked)} tasks still run: {leaked}")
+
+    def stats(self):
+        return {
+            "running": len(self.tasks),
+            "spawned": self.spawned,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "leaked": self.leaked,
+        }
@@ -2,14 +2,22 @@ from .game import Game
 from .player import Player
 from _datetime import datetime
 from .game_status import GameStatus
+from .frame import DeltaEncoder
+from .game_tasks import GameTasks
+from .lobby import Lobby
 
 import asyncio
+import time
 
 class GameWrapper:
     def __init__(self, game_id: str):
 
         self.created_at = datetime.now()
         self.status = GameStatus.WAITING
+        # instant du dernier changement de statut, l'age d'une partie se compte par statut
+        self.status_since = time.monotonic()
+        # premier passage du reaper sans aucun client connecte, None sinon
+        self.orphan_since = None
 
         self.game_id = game_id
         self.game_is_initialized = asyncio.Event()
@@ -21,15 +29,42 @@ class GameWrapper:
         self.waiting_for_ai = asyncio.Event()
         self.received_names = asyncio.Event()
         self.ai_partner = True
+        # etapes connecte -> noms -> pret -> compte a rebours -> en jeu
+        self.lobby = Lobby()
 
         self.has_resumed_count = 0
         self.has_resumed = asyncio.Event()
 
-        self.player_1 = Player()
-        self.player_2 = Player()
-
         self.present_players = 0
         self.game = Game()
 
+        self.player_1 = Player(self.game.paddle1)
+        self.player_2 = Player(self.game.paddle2)
+        self.delta_encoder = DeltaEncoder()
+        # consumers connectes a la partie : nom de canal -> format des etats ("json", "binary", "delta")
+        self.connections = {}
+        # spectateurs en lecture seule, hors limite des deux joueurs : nom de canal -> format
+        self.spectators = {}
+        # une frame sur spectator_interval pour les spectateurs, plus tous les changements d'etat
+        self.spectator_interval = 2
+        self.spectator_marker = None
+
+        # partie importee d'un autre processus (snapshot) : les joueurs se reconnectent
+        # avec leur token et retrouvent leur cote
+        self.restored = False
+        self.main_side = None
+        self.resumed = asyncio.Event()
+        # physique arretee en attendant le retour des joueurs (migration, coupure reseau)
+        self.suspended = False
+        # une seule boucle d'envoi des etats par partie
+        self.frame_loop_running = False
+        # coroutines de la partie et de ses clients, annulees quand la partie est retiree
+        self.tasks = GameTasks(game_id)
+
     def get_game(self):
         return self.game
+
+    def set_status(self, status: GameStatus):
+        if status != self.status:
+            self.status = status
+            self.status_since = time.monotonic()
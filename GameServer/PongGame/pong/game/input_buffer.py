@@ -0,0 +1,55 @@
+from collections import deque
+
+
+SEQUENCE_MODULO = 1 << 16
+
+
+# Entrees d'un joueur en attente : chacune vise un tick de la physique et n'est
+# appliquee qu'au debut de ce tick, quel que soit le moment ou le message arrive.
+class InputBuffer:
+
+    def __init__(self, max_size=32, max_delay=250):
+        self.pending = deque()
+        self.max_size = max_size
+        # un client ne peut pas viser plus de max_delay ticks dans le futur
+        self.max_delay = max_delay
+        # dernier tick consomme par la physique
+        self.tick = 0
+        self.last_target = 0
+        self.last_received = None
+        # derniere sequence appliquee, renvoyee dans chaque etat pour la reconciliation client
+        self.last_sequence = None
+
+    def push(self, action, sequence=None, tick=None):
+        if sequence is not None:
+            # numero sur 16 bits qui reboucle : on ignore les doublons et les entrees en retard
+            if self.last_received is not None:
+                distance = (sequence - self.last_received) % SEQUENCE_MODULO
+                if distance == 0 or distance >= SEQUENCE_MODULO // 2:
+                    return False
+            self.last_received = sequence
+
+        target = self.tick if tick is None else min(max(tick, self.tick), self.tick + self.max_delay)
+        # une entree ne passe jamais avant une entree recue plus tot
+        target = max(target, self.last_target)
+        self.last_target = target
+
+        if len(self.pending) >= self.max_size:
+            self.pending.popleft()
+        self.pending.append((target, action, sequence))
+        return True
+
+    def pop_ready(self, tick, flush=False):
+        # renvoie la derniere action dont le tick est atteint, None s'il n'y en a pas
+        self.tick = tick
+        action = None
+        while self.pending and (flush or self.pending[0][0] <= tick):
+            _, action, sequence = self.pending.popleft()
+            if sequence is not None:
+                self.last_sequence = sequence
+        return action
+
+    def reset(self):
+        self.pending.clear()
+        self.last_target = self.tick
+        self.last_received = None
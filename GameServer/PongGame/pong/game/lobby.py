@@ -0,0 +1,47 @@
+import os
+import time
+from enum import Enum
+
+
+# compte a rebours entre le start des joueurs et la premiere frame, en ticks du scheduler
+LOBBY_COUNTDOWN_TICKS = int(os.getenv('LOBBY_COUNTDOWN_TICKS', '60'))
+
+
+class LobbyState(Enum):
+    WAITING = "waiting"        # un seul cote connecte
+    CONNECTED = "connected"    # le second joueur a rejoint
+    NAMED = "named"            # noms des joueurs recus
+    READY = "ready"            # start recu
+    COUNTDOWN = "countdown"    # compte a rebours sur l'horloge du scheduler
+    PLAYING = "playing"        # premiere frame envoyee
+
+    def __str__(self):
+        return self.value
+
+
+# Etapes du lobby d'une partie, franchies dans l'ordre par la boucle des etats a mesure
+# que les evenements du GameWrapper arrivent ; chaque etape garde l'instant ou elle a
+# ete atteinte pour mesurer le temps entre l'arrivee du second joueur et la premiere frame.
+class Lobby:
+
+    def __init__(self):
+        self.state = LobbyState.WAITING
+        self.entered = {LobbyState.WAITING: time.monotonic()}
+
+    def enter(self, state: LobbyState, at: float = None):
+        self.state = state
+        self.entered[state] = time.monotonic() if at is None else at
+
+    def start_latency(self):
+        # secondes entre l'arrivee du second joueur et la premiere frame, None si pas encore jouee
+        if LobbyState.CONNECTED not in self.entered or LobbyState.PLAYING not in self.entered:
+            return None
+        return self.entered[LobbyState.PLAYING] - self.entered[LobbyState.CONNECTED]
+
+    def timings(self):
+        # ms depuis l'arrivee du second joueur pour chaque etape suivante
+        joined = self.entered.get(LobbyState.CONNECTED)
+        if joined is None:
+            return {}
+        return {str(state): round(1000 * (at - joined), 1)
+                for state, at in self.entered.items() if state != LobbyState.WAITING}
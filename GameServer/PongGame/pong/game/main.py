@@ -1,10 +1,33 @@
-from game import Game
+import argparse
 import asyncio
+import json
+
+from .game import Game
+from .simulation import simulate_matches, idle_controller, tracking_controller, predicting_controller
+
+CONTROLLERS = {
+    "idle": idle_controller,
+    "tracking": tracking_controller,
+    "predicting": predicting_controller,
+}
 
 async def launch(game):
     async for state in game.rungame():
-        print(state)
+        print(state.encode())
 
+# python -m pong.game.main [--headless --matches 10 --seed 0 --p1 predicting --p2 tracking]
 if __name__ == "__main__":
-    game = Game()
-    asyncio.run(launch(game))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--matches", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--p1", choices=CONTROLLERS, default="predicting")
+    parser.add_argument("--p2", choices=CONTROLLERS, default="tracking")
+    args = parser.parse_args()
+
+    if args.headless:
+        results = simulate_matches(args.matches, CONTROLLERS[args.p1], CONTROLLERS[args.p2], seed=args.seed)
+        print(json.dumps(results, indent=2))
+    else:
+        game = Game()
+        asyncio.run(launch(game))
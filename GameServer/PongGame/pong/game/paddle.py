@@ -1,4 +1,7 @@
 import logging
+import math
+
+from .input_buffer import InputBuffer
 
 class Paddle:
     
@@ -10,7 +13,12 @@ class Paddle:
         self.win_width = win_width
         self.win_height = win_height
         self.vel = round(win_height / 333)
-        self.lastTouch = 0
+        # vitesse en pixels par seconde : 5 pas de vel par frame a 60 fps
+        self.speed = self.vel * 5 * 60
+        # 1 monte, -1 descend, 0 immobile ; integre a chaque tick de la physique
+        self.action = 0
+        self.inputs = InputBuffer()
+        self.lastTouch = -math.inf
         self.canMove = True
         self.score = 0
 
@@ -23,13 +31,17 @@ class Paddle:
             down = True
         if up is True:
             while self.y + self.height / 2 < self.win_height / 2 + 10:
-                self.move(self.win_height, up=False)
+                self.shift(self.win_height, up=False)
         else:
             while self.y + self.height / 2 > self.win_height / 2 - 10:
-                self.move(self.win_height, up=True)
+                self.shift(self.win_height, up=True)
 
 
     async def move(self, height, up=True):
+        self.shift(height, up)
+
+
+    def shift(self, height, up=True):
 
         temp = self.y
         if up:
@@ -42,10 +54,24 @@ class Paddle:
                 temp = height - self.height
         self.y = temp
 
+
+    def apply_inputs(self, tick, flush=False):
+        action = self.inputs.pop_ready(tick, flush)
+        if action is not None:
+            self.action = action
+
+
+    def integrate(self, dt, height):
+        if self.action == 1:
+            self.y = max(0, self.y - self.speed * dt)
+        elif self.action == -1:
+            self.y = min(height - self.height, self.y + self.speed * dt)
+
     def serialize(self, game):
         res:dict = {}
         res["x"] = self.x / game.width
         res["y"] = (self.y + self.height / 2) / game.height
         res["score"] = self.score
+        res["sequence"] = self.inputs.last_sequence
 
         return res
\ No newline at end of file
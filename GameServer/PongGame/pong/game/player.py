@@ -3,5 +3,28 @@ class Player():
     is_connected = False
     is_ready = False
     is_ready_for_next_point = False
-    action = 0
     name = None
+    # empreinte du token du client qui tient ce cote, pour le retrouver a la reconnexion
+    token_digest = None
+    # instant (monotonic) de la coupure, pour mesurer le temps de retour
+    disconnected_at = None
+
+    def __init__(self, paddle=None):
+        self.paddle = paddle
+        self._action = 0
+
+    # action appliquee a la raquette ; une nouvelle action passe par la file
+    # d'entrees et n'est prise en compte qu'au tick suivant
+    @property
+    def action(self):
+        return self.paddle.action if self.paddle is not None else self._action
+
+    @action.setter
+    def action(self, value):
+        self.push_input(value)
+
+    def push_input(self, action, sequence=None, tick=None):
+        if self.paddle is None:
+            self._action = action
+            return True
+        return self.paddle.inputs.push(action, sequence, tick)
@@ -0,0 +1,125 @@
+import random
+import time
+
+from .game import Game
+from .clock import TickClock
+
+
+# Simulation sans reseau ni asyncio : les parties tournent aussi vite que le CPU
+# le permet, avec une horloge de ticks et un generateur aleatoire seedes.
+# Un controleur est une fonction (game, paddle) -> action : 1 monte, -1 descend, 0 immobile.
+
+def idle_controller(game, paddle):
+    return 0
+
+
+def tracking_controller(game, paddle):
+    # suit la position verticale de la balle
+    center = paddle.y + paddle.height / 2
+    if game.ball.y < center - paddle.vel:
+        return 1
+    if game.ball.y > center + paddle.vel:
+        return -1
+    return 0
+
+
+def predicting_controller(game, paddle):
+    # se place au point d'impact predit, comme le fait l'IA a partir de ai_data
+    target = game.ball.predictNextCollision(paddle)[1]
+    center = paddle.y + paddle.height / 2
+    if target < center - paddle.vel:
+        return 1
+    if target > center + paddle.vel:
+        return -1
+    return 0
+
+
+def step_all(games, clock):
+    # un tick de physique pour des parties qui partagent la meme horloge, avancee une seule fois
+    for game in games:
+        game.step()
+    clock.advance()
+
+
+def simulate_match(controller1=tracking_controller, controller2=tracking_controller, seed=None,
+                   score_limit=None, max_ticks=2_000_000, serve=True, game=None):
+    rng = random.Random(seed)
+    if game is None:
+        game = Game(clock=TickClock(), rng=rng)
+    if score_limit is not None:
+        game.scoreLimit = score_limit
+    if serve:
+        # engagement avec un angle aleatoire comme apres un but, sinon la balle part
+        # a plat vers le centre de la raquette et l'echange peut ne jamais finir
+        game.ball.reset(game.rng.choice((-1, 1)))
+
+    frame_duration = 1 / game.frame_rate
+    rallies = []
+    rally_start = game.tick
+    rally_hits = 0
+    last_touch1 = game.paddle1.lastTouch
+    last_touch2 = game.paddle2.lastTouch
+
+    started_at = time.perf_counter()
+    while not game.isgameover() and game.tick < max_ticks:
+        game.advance(frame_duration)
+
+        if game.paddle1.lastTouch != last_touch1 or game.paddle2.lastTouch != last_touch2:
+            rally_hits += 1
+            last_touch1 = game.paddle1.lastTouch
+            last_touch2 = game.paddle2.lastTouch
+
+        if game.goal1 or game.goal2:
+            rallies.append({
+                "scorer": "1" if game.goal1 else "2",
+                "ticks": game.tick - rally_start,
+                "hits": rally_hits,
+            })
+            if game.isgameover():
+                break
+            game.resume_point()
+            rally_start = game.tick
+            rally_hits = 0
+            continue
+
+        # les controleurs decident a chaque frame, la physique deplace les raquettes a chaque tick
+        game.paddle1.action = controller1(game, game.paddle1)
+        game.paddle2.action = controller2(game, game.paddle2)
+    elapsed = time.perf_counter() - started_at
+
+    if game.paddle1.score >= game.scoreLimit:
+        winner = "1"
+    elif game.paddle2.score >= game.scoreLimit:
+        winner = "2"
+    else:
+        winner = None
+
+    return {
+        "seed": seed,
+        "winner": winner,
+        "score1": game.paddle1.score,
+        "score2": game.paddle2.score,
+        "rallies": rallies,
+        "ticks": game.tick,
+        "game_seconds": game.tick / game.physics_rate,
+        "wall_seconds": elapsed,
+        "ticks_per_second": game.tick / elapsed if elapsed > 0 else None,
+        "speedup": (game.tick / game.physics_rate) / elapsed if elapsed > 0 else None,
+    }
+
+
+def simulate_matches(count, controller1=tracking_controller, controller2=tracking_controller, seed=0, **kwargs):
+    results = [simulate_match(controller1, controller2, seed=seed + i, **kwargs) for i in range(count)]
+    rally_ticks = [rally["ticks"] for result in results for rally in result["rallies"]]
+    wall_seconds = sum(result["wall_seconds"] for result in results)
+    ticks = sum(result["ticks"] for result in results)
+
+    return {
+        "matches": results,
+        "wins1": sum(1 for result in results if result["winner"] == "1"),
+        "wins2": sum(1 for result in results if result["winner"] == "2"),
+        "mean_rally_ticks": sum(rally_ticks) / len(rally_ticks) if rally_ticks else 0,
+        "max_rally_ticks": max(rally_ticks, default=0),
+        "wall_seconds": wall_seconds,
+        "ticks_per_second": ticks / wall_seconds if wall_seconds > 0 else None,
+    }
@@ -0,0 +1,145 @@
+import json
+import math
+import zlib
+from datetime import datetime
+
+from .game_wrapper import GameWrapper
+from .game_status import GameStatus
+
+
+# Sauvegarde compacte d'une partie (Game, Ball, Paddle, scores, Player et etat du lobby)
+# pour la deplacer vers un autre processus du serveur de jeu. Les instants lus sur
+# l'horloge sont stockes en age (secondes ecoulees) et recales sur l'horloge de
+# l'importeur ; les entrees en attente ne sont pas gardees, les clients renvoient
+# leur direction courante en se reconnectant.
+
+SNAPSHOT_VERSION = 1
+
+LOBBY_EVENTS = ("ai_is_initialized", "all_players_connected", "received_names", "start_event", "waiting_for_ai")
+PLAYER_FIELDS = ("type", "is_connected", "is_ready", "is_ready_for_next_point", "name", "token_digest")
+
+
+def _age(now, timestamp):
+    return None if timestamp is None or math.isinf(timestamp) else now - timestamp
+
+
+def _since(now, age, default):
+    return default if age is None else now - age
+
+
+def snapshot_paddle(paddle, now) -> dict:
+    return {
+        "y": paddle.y,
+        "action": paddle.action,
+        "score": paddle.score,
+        "canMove": paddle.canMove,
+        "lastTouch": _age(now, paddle.lastTouch),
+        "sequence": paddle.inputs.last_sequence,
+        "received": paddle.inputs.last_received,
+    }
+
+
+def restore_paddle(paddle, data, now):
+    paddle.y = data["y"]
+    paddle.action = data["action"]
+    paddle.score = data["score"]
+    paddle.canMove = data["canMove"]
+    paddle.lastTouch = _since(now, data["lastTouch"], -math.inf)
+    paddle.inputs.last_sequence = data["sequence"]
+    paddle.inputs.last_received = data["received"]
+
+
+def snapshot_game(wrapper: GameWrapper) -> dict:
+    game = wrapper.game
+    ball = game.ball
+    now = game.clock.now()
+    return {
+        "version": SNAPSHOT_VERSION,
+        "game_id": wrapper.game_id,
+        "created_at": wrapper.created_at.isoformat(),
+        "lobby": [name for name in LOBBY_EVENTS if getattr(wrapper, name).is_set()],
+        "players": [{field: getattr(player, field) for field in PLAYER_FIELDS}
+                    for player in (wrapper.player_1, wrapper.player_2)],
+        "main_side": wrapper.main_side,
+        "game": {
+            "tick": game.tick,
+            "pause": game.pause,
+            "goal1": game.goal1,
+            "goal2": game.goal2,
+            "gameOver": game.gameOver,
+            "scoreLimit": game.scoreLimit,
+            "running_ai": getattr(game, "RUNNING_AI", False),
+            "lastSentInfos": _age(now, game.lastSentInfos or None),
+        },
+        "ball": {
+            "x": ball.x,
+            "y": ball.y,
+            "x_vel": ball.x_vel,
+            "y_vel": ball.y_vel,
+            "max_speed": ball.max_speed,
+            "lastTouch": ball.lastTouch,
+            "touchedWall": ball.touchedWall,
+            "friction": _age(now, ball.frictionTimestamp),
+        },
+        "paddles": [snapshot_paddle(game.paddle1, now), snapshot_paddle(game.paddle2, now)],
+    }
+
+
+def restore_game(data: dict, game_id: str = None) -> GameWrapper:
+    if data.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version: {data.get('version')}")
+
+    wrapper = GameWrapper(game_id or data["game_id"])
+    wrapper.created_at = datetime.fromisoformat(data["created_at"])
+    wrapper.restored = True
+    wrapper.suspended = True
+    wrapper.set_status(GameStatus.PAUSED)
+    wrapper.main_side = data["main_side"]
+    for name in data["lobby"]:
+        getattr(wrapper, name).set()
+    for player, fields in zip((wrapper.player_1, wrapper.player_2), data["players"]):
+        for field in PLAYER_FIELDS:
+            setattr(player, field, fields[field])
+        # les joueurs doivent se reconnecter sur ce processus
+        player.is_connected = False
+
+    game = wrapper.game
+    now = game.clock.now()
+    state = data["game"]
+    game.tick = state["tick"]
+    game.pause = state["pause"]
+    game.goal1 = state["goal1"]
+    game.goal2 = state["goal2"]
+    game.gameOver = state["gameOver"]
+    game.scoreLimit = state["scoreLimit"]
+    game.RUNNING_AI = state["running_ai"]
+    game.lastSentInfos = _since(now, state["lastSentInfos"], 0)
+
+    ball = game.ball
+    state = data["ball"]
+    ball.x = state["x"]
+    ball.y = state["y"]
+    ball.x_vel = state["x_vel"]
+    ball.y_vel = state["y_vel"]
+    ball.max_speed = state["max_speed"]
+    ball.lastTouch = state["lastTouch"]
+    ball.touchedWall = state["touchedWall"]
+    ball.frictionTimestamp = _since(now, state["friction"], now)
+    ball.invalidateTrajectory()
+
+    restore_paddle(game.paddle1, data["paddles"][0], now)
+    restore_paddle(game.paddle2, data["paddles"][1], now)
+    for paddle in (game.paddle1, game.paddle2):
+        paddle.inputs.tick = game.tick
+        paddle.inputs.last_target = game.tick
+    game.NewCalculusNeeded = True
+    game.update_next_collision()
+    return wrapper
+
+
+def encode_snapshot(data: dict) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+
+
+def decode_snapshot(payload: bytes) -> dict:
+    return json.loads(zlib.decompress(payload))
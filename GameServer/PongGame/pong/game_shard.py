@@ -0,0 +1,36 @@
+import os
+
+
+# Shard du serveur de jeu qui heberge une partie, ecrit dans son uid : le deuxieme
+# groupe de l'uuid (4 chiffres hexa) est remplace par le numero du shard. Le premier
+# et le dernier caractere (mode, difficulte, cote de l'IA) ne sont pas touches, et
+# nginx peut router /ws/pong/<uid>/ sans rien demander a personne.
+# Meme fichier dans matchmaking/matchmaking_service/matchmaking/.
+
+SHARD_DIGITS = 4
+MAX_SHARDS = 16 ** SHARD_DIGITS
+
+
+def shard_count() -> int:
+    return max(1, min(int(os.getenv('GAME_SHARDS', '1')), MAX_SHARDS))
+
+
+def local_shard() -> int:
+    return int(os.getenv('GAME_SHARD_ID', '0'))
+
+
+def with_shard(uid: str, shard: int) -> str:
+    groups = uid.split('-')
+    groups[1] = format(shard, f'0{SHARD_DIGITS}x')
+    return '-'.join(groups)
+
+
+def shard_of(uid: str):
+    # None si l'uid ne suit pas le format (pas de deuxieme groupe hexa)
+    groups = uid.split('-')
+    if len(groups) < 3 or len(groups[1]) != SHARD_DIGITS:
+        return None
+    try:
+        return int(groups[1], 16)
+    except ValueError:
+        return None
@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+# Ticket de partie signe par le matchmaking (HMAC-SHA256, secret GAME_TICKET_SECRET partage) :
+# il lie l'uid de la partie, le token du joueur et une date d'expiration, et se verifie
+# sans appel reseau. Meme fichier dans matchmaking/matchmaking_service/matchmaking/.
+
+TICKET_TTL = 120
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def token_digest(token: str) -> str:
+    # le token brut n'apparait jamais dans le ticket ; "Bearer" est ignore des deux cotes
+    return hashlib.sha256(token.replace('Bearer', '').strip().encode()).hexdigest()
+
+
+def _sign(secret: str, payload: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_ticket(secret: str, uid: str, token: str, ttl=TICKET_TTL, now=None) -> str:
+    now = time.time() if now is None else now
+    payload = _b64encode(json.dumps({
+        "uid": uid,
+        "tok": token_digest(token),
+        "exp": int(now + ttl),
+    }, separators=(',', ':')).encode())
+    return f"{payload}.{_sign(secret, payload)}"
+
+
+def verify_ticket(secret: str, ticket: str, uid: str, token: str, now=None) -> bool:
+    try:
+        payload, signature = ticket.split('.')
+        if not hmac.compare_digest(signature, _sign(secret, payload)):
+            return False
+        claims = json.loads(_b64decode(payload))
+        now = time.time() if now is None else now
+        return (claims["uid"] == uid
+                and hmac.compare_digest(claims["tok"], token_digest(token))
+                and claims["exp"] > now)
+    except (ValueError, TypeError, KeyError):
+        return False
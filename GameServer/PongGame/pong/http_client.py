@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import random
+
+import aiohttp
+
+
+# Client HTTP partage par tous les consumers pour les appels internes via nginx :
+# une seule session aiohttp par processus, connexions TLS gardees ouvertes et reutilisees.
+
+# timeout total (secondes) et nombre de nouvelles tentatives par endpoint ;
+# l'envoi des stats incremente des compteurs, il n'est donc jamais rejoue
+ENDPOINTS = {
+    "verify": {"timeout": 3, "retries": 2},
+    "cleanup": {"timeout": 5, "retries": 2},
+    "rename": {"timeout": 3, "retries": 2},
+    "stats": {"timeout": 5, "retries": 0},
+}
+DEFAULT_ENDPOINT = {"timeout": 5, "retries": 0}
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class InternalHttpClient:
+
+    def __init__(self, base_url=None, pool_size=100, keepalive_timeout=30, retry_delay=0.1):
+        self.base_url = base_url or os.getenv('INTERNAL_API_URL', 'https://nginx:7777')
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.retry_delay = retry_delay
+        self._session = None
+        self._loop = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        # cree a la premiere utilisation, dans la boucle qui tourne (et recree si elle a change)
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is not loop:
+            await self._discard_session()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=False,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def _discard_session(self):
+        # session d'une autre boucle : fermee avant d'etre remplacee pour ne pas garder son connecteur
+        session, loop = self._session, self._loop
+        self._session = None
+        self._loop = None
+        if session.closed:
+            return
+        if loop.is_running():
+            # boucle d'un autre thread : la fermeture s'y execute
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        try:
+            await session.close()
+        except RuntimeError as e:
+            logging.warning(f"could not close HTTP session of a stopped loop: {str(e)}")
+
+    async def request(self, method, endpoint, path, **kwargs):
+        settings = ENDPOINTS.get(endpoint, DEFAULT_ENDPOINT)
+        timeout = aiohttp.ClientTimeout(total=settings["timeout"])
+        retries = settings["retries"]
+
+        for attempt in range(retries + 1):
+            try:
+                async with (await self.session()).request(method, self.base_url + path, timeout=timeout, **kwargs) as response:
+                    text = await response.text()
+                    if response.status not in RETRY_STATUSES or attempt == retries:
+                        return response.status, text
+                    logging.warning(f"{endpoint} request returned {response.status}, retrying")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == retries:
+                    raise
+                logging.warning(f"{endpoint} request error: {str(e)}, retrying")
+            # backoff exponentiel avec jitter pour ne pas relancer tous les clients en meme temps
+            await asyncio.sleep(self.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def close(self):
+        if self._session is not None and self._loop is not asyncio.get_running_loop():
+            await self._discard_session()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+# Instance unique
+internal_http = InternalHttpClient()
@@ -0,0 +1,24 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from pong.game.game_manager import game_manager
+
+
+class Command(BaseCommand):
+    help = "Deplace les parties d'un shard du serveur de jeu vers un autre (redeploiement, reequilibrage)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='source', type=int, required=True, help="shard qui heberge les parties")
+        parser.add_argument('--to', dest='target', type=int, required=True, help="shard qui les reprend")
+        parser.add_argument('--game', dest='game_id', default=None, help="uid d'une seule partie (toutes par defaut)")
+
+    def handle(self, *args, **options):
+        # l'ordre passe par le channel layer partage (Redis) : le processus du shard source
+        # exporte ses parties et redirige ses clients
+        async_to_sync(get_channel_layer().send)(game_manager.shard_channel(options['source']), {
+            "type": "game.migrate",
+            "game_id": options['game_id'],
+            "shard": options['target'],
+        })
+        self.stdout.write(f"migration of shard {options['source']} to shard {options['target']} requested")
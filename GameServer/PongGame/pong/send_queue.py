@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+
+# File d'envoi d'un client, videe par son propre writer : un socket lent ne bloque
+# ni la boucle de jeu ni le traitement des messages du channel layer.
+# Les messages de controle (noms, gameover...) et les frames qui changent l'etat de la
+# partie (but, reprise, fin) sont toujours gardes ; au-dela de max_frames frames en
+# attente, la plus ancienne est jetee au profit de la plus recente.
+class SendQueue:
+
+    def __init__(self, max_frames=3):
+        self.max_frames = max_frames
+        # (kind, payload, enqueued_at, droppable)
+        self.entries = deque()
+        self.droppable = 0
+        self.last_marker = None
+        self.ready = asyncio.Event()
+        self.closed = False
+        # debut de l'envoi en cours, None entre deux envois
+        self.sending_since = None
+        self.sent = 0
+        self.dropped = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def push_message(self, text):
+        self._push("message", text, False)
+
+    def push_frame(self, event, kind="frame"):
+        # une frame dont le marqueur change (but, reprise, gameover) n'est jamais jetee
+        marker = event.get("marker")
+        droppable = marker == self.last_marker
+        self.last_marker = marker
+        if droppable and self.droppable >= self.max_frames:
+            self._drop_oldest_frame()
+        self._push(kind, event, droppable)
+
+    def _push(self, kind, payload, droppable):
+        if self.closed:
+            return
+        self.entries.append((kind, payload, time.monotonic(), droppable))
+        if droppable:
+            self.droppable += 1
+        self.ready.set()
+
+    def _drop_oldest_frame(self):
+        for index, entry in enumerate(self.entries):
+            if entry[3]:
+                del self.entries[index]
+                self.droppable -= 1
+                self.dropped += 1
+                return
+
+    async def run(self, send):
+        # send(kind, payload) : envoi reel sur le socket, appele dans l'ordre d'arrivee
+        while True:
+            while not self.entries:
+                if self.closed:
+                    return
+                self.ready.clear()
+                await self.ready.wait()
+            kind, payload, enqueued_at, droppable = self.entries.popleft()
+            if droppable:
+                self.droppable -= 1
+            lag = time.monotonic() - enqueued_at
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            self.sending_since = time.monotonic()
+            try:
+                await send(kind, payload)
+            except Exception as e:
+                logging.error(f"send queue writer error: {str(e)}")
+                self.close()
+                return
+            finally:
+                self.sending_since = None
+            self.sent += 1
+
+    def stalled_for(self) -> float:
+        # temps passe bloque sur l'envoi en cours (socket qui ne se vide plus)
+        if self.sending_since is None:
+            return 0.0
+        return time.monotonic() - self.sending_since
+
+    def close(self):
+        self.closed = True
+        self.entries.clear()
+        self.droppable = 0
+        self.ready.set()
+
+    def stats(self):
+        return {
+            "queued": len(self.entries),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "avg_lag_ms": round(1000 * self.total_lag / self.sent, 2) if self.sent else 0.0,
+            "max_lag_ms": round(1000 * self.max_lag, 2),
+        }
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+import sys
+
+from .http_client import internal_http
+
+
+# Fermeture des ressources partagees du processus (session HTTP interne) a l'arret du serveur.
+# Un serveur ASGI avec lifespan passe par lifespan() ; daphne ne l'envoie pas, on se
+# branche donc aussi sur l'arret du reactor twisted s'il est deja installe.
+
+async def close_resources():
+    try:
+        await internal_http.close()
+    except Exception as e:
+        logging.error(f"Error while closing the internal HTTP client: {str(e)}")
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_resources()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def install_reactor_hook():
+    if "twisted.internet.reactor" not in sys.modules:
+        return
+    from twisted.internet import defer, reactor
+
+    def before_shutdown():
+        return defer.Deferred.fromFuture(asyncio.ensure_future(close_resources()))
+
+    reactor.addSystemEventTrigger("before", "shutdown", before_shutdown)
@@ -1,3 +1,880 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import json
+import math
+import random
+import struct
+import time
+from pathlib import Path
 
-# Create your tests here.
+from aiohttp import web
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+from unittest import skipUnless
+
+from .game import Game
+from .game.batch_engine import BatchGame, WALLS
+from .game.clock import ManualClock, TickClock
+from .game.frame import DeltaEncoder, INPUT_MESSAGE, frame_event, spectator_event
+from .game.game_wrapper import GameWrapper
+from .game.game_status import GameStatus
+from . import consumers
+from .consumers import PongConsumer
+from .http_client import InternalHttpClient, internal_http
+from .shutdown import lifespan
+from .game_ticket import issue_ticket, token_digest, verify_ticket
+from .jwt_cache import JwtCache
+from .game_shard import shard_of, with_shard
+from .send_queue import SendQueue
+from .game.player import Player
+from .game.game_manager import GameManager, game_manager
+from .game import game_tasks
+from .game.game_tasks import GameTasks
+from .game.lobby import LobbyState
+from .game.snapshot import snapshot_game, restore_game, encode_snapshot, decode_snapshot
+from .game.simulation import simulate_match, step_all, idle_controller, predicting_controller
+
+
+class NextCollisionPositionTests(SimpleTestCase):
+
+    def random_ball(self, game, rng):
+        ball = game.ball
+        ball.x = rng.uniform(-5, game.width + 5)
+        ball.y = rng.uniform(-20, game.height + 20)
+        speed = rng.uniform(0.5, ball.max_speed)
+        angle = rng.uniform(-math.pi, math.pi)
+        ball.x_vel = speed * math.cos(angle)
+        ball.y_vel = speed * math.sin(angle)
+        if abs(ball.x_vel) < 0.05:
+            ball.x_vel = math.copysign(0.05, ball.x_vel)
+        return ball
+
+    def test_matches_simulation(self):
+        rng = random.Random(42)
+        for _ in range(2000):
+            game = Game()
+            ball = self.random_ball(game, rng)
+            for paddle in (game.paddle1, game.paddle2):
+                paddle.y = rng.uniform(0, game.height - paddle.height)
+                expected = ball.simulateNextCollisionPosition(paddle)
+                result = ball.calculateNextCollisionPosition(paddle)
+                self.assertEqual(result[0], expected[0])
+                self.assertAlmostEqual(result[1], expected[1], places=6)
+
+    def test_straight_ball(self):
+        game = Game()
+        game.ball.x_vel = 10
+        game.ball.y_vel = 0
+        self.assertEqual(game.ball.calculateNextCollisionPosition(game.paddle2), [1, game.height // 2])
+
+    def test_prediction_cached_until_trajectory_changes(self):
+        game = Game()
+        ball = game.ball
+        first = ball.predictNextCollision(game.paddle2)
+        ball.move()
+        self.assertIs(ball.predictNextCollision(game.paddle2), first)
+        ball.bounceOnWall()
+        self.assertIsNot(ball.predictNextCollision(game.paddle2), first)
+
+
+class BatchGameParityTests(SimpleTestCase):
+
+    def random_game(self, rng, clock=None):
+        game = Game(clock=clock)
+        ball = game.ball
+        ball.x = rng.choice([rng.uniform(0, game.width), rng.uniform(30, 70), rng.uniform(1430, 1470)])
+        ball.y = rng.uniform(0, game.height)
+        speed = rng.uniform(0.3, ball.max_speed)
+        angle = rng.uniform(-math.pi, math.pi)
+        ball.x_vel = speed * math.cos(angle)
+        ball.y_vel = speed * math.sin(angle)
+        game.paddle1.y = ball.y - rng.uniform(-20, game.paddle1.height + 20)
+        game.paddle2.y = ball.y - rng.uniform(-20, game.paddle2.height + 20)
+        ball.frictionTimestamp = rng.choice([0, 1000.0])
+        game.paddle1.lastTouch = rng.choice([0, 999.8])
+        game.paddle2.lastTouch = rng.choice([0, 999.8])
+        game.pause = rng.random() < 0.1
+        game.paddle1.action = rng.choice([-1, 0, 1])
+        game.paddle2.action = rng.choice([-1, 0, 1])
+        return game
+
+    def test_step_matches_game(self):
+        rng = random.Random(1)
+        clock = ManualClock(1000.0)
+        games = [self.random_game(rng, clock) for _ in range(500)]
+        batch = BatchGame.from_games(games, clock=clock)
+
+        for _ in range(30):
+            for game in games:
+                game.step()
+            batch.step()
+            clock.forward(0.05)
+
+        for i, game in enumerate(games):
+            self.assertAlmostEqual(batch.ball_x[i], game.ball.x, places=9)
+            self.assertAlmostEqual(batch.ball_y[i], game.ball.y, places=9)
+            self.assertAlmostEqual(batch.ball_x_vel[i], game.ball.x_vel, places=9)
+            self.assertAlmostEqual(batch.ball_y_vel[i], game.ball.y_vel, places=9)
+            self.assertAlmostEqual(batch.paddle1_y[i], game.paddle1.y, places=9)
+            self.assertAlmostEqual(batch.paddle2_y[i], game.paddle2.y, places=9)
+            self.assertEqual(batch.ball_last_touch[i], int(game.ball.lastTouch))
+            self.assertEqual(WALLS[batch.touched_wall[i]], game.ball.touchedWall)
+            self.assertEqual(batch.score1[i], game.paddle1.score)
+            self.assertEqual(batch.score2[i], game.paddle2.score)
+            self.assertEqual(batch.pause[i], game.pause)
+
+    def test_store_game_round_trip(self):
+        rng = random.Random(2)
+        game = self.random_game(rng)
+        batch = BatchGame.from_games([game])
+        batch.step()
+        restored = Game()
+        batch.store_game(0, restored)
+        self.assertEqual(restored.ball.x, batch.ball_x[0])
+        self.assertEqual(restored.paddle1.y, batch.paddle1_y[0])
+        self.assertEqual(restored.pause, batch.pause[0])
+        self.assertEqual(restored.ball.touchedWall, WALLS[batch.touched_wall[0]])
+
+
+class PaddleMovementTests(SimpleTestCase):
+
+    def test_action_is_integrated_each_tick(self):
+        game = Game(clock=TickClock())
+        player = Player(game.paddle1)
+        start = game.paddle1.y
+        player.action = -1
+        for _ in range(game.physics_rate // 10):
+            game.step()
+        self.assertAlmostEqual(game.paddle1.y, start + game.paddle1.speed / 10)
+
+        player.action = 1
+        for _ in range(game.physics_rate * 2):
+            game.step()
+        self.assertEqual(game.paddle1.y, 0)
+
+
+class BinaryInputTests(SimpleTestCase):
+
+    def consumer(self, side, mode="PVP_LAN"):
+        consumer = PongConsumer()
+        consumer.game_wrapper = GameWrapper("test")
+        consumer.side = side
+        consumer.mode = mode
+        return consumer
+
+    def test_input_moves_own_paddle_in_sequence_order(self):
+        consumer = self.consumer("p2")
+        players = consumer.game_wrapper
+        game = players.game
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(0, 1, 65535))
+        # mis en file, applique au prochain tick
+        self.assertEqual(players.player_2.action, 0)
+        game.step()
+        self.assertEqual(players.player_2.action, 1)
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(0, -1, 0))
+        # en retard ou pour l'autre joueur : ignore
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(0, 0, 65535))
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(1, 1, 1))
+        game.step()
+        self.assertEqual(players.player_2.action, -1)
+        self.assertEqual(players.player_1.action, 0)
+        self.assertEqual(game.frame().state["paddle2"]["sequence"], 0)
+
+    def test_shared_keyboard_moves_both_paddles(self):
+        consumer = self.consumer(None, mode="PVP_keyboard")
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(1, -1, 0))
+        consumer.handle_binary_input(INPUT_MESSAGE.pack(2, 1, 1))
+        consumer.game_wrapper.game.step()
+        self.assertEqual(consumer.game_wrapper.game.paddle1.action, -1)
+        self.assertEqual(consumer.game_wrapper.game.paddle2.action, 1)
+
+
+class InputBufferTests(SimpleTestCase):
+
+    def test_inputs_apply_at_their_target_tick(self):
+        game = Game(clock=TickClock())
+        inputs = game.paddle1.inputs
+        inputs.push(-1, sequence=1, tick=5)
+        inputs.push(1, sequence=2, tick=8)
+        # une entree plus recente ne passe pas avant les precedentes
+        inputs.push(0, sequence=3, tick=2)
+        applied = []
+        for _ in range(10):
+            game.step()
+            applied.append((game.paddle1.action, inputs.last_sequence))
+        self.assertEqual(applied[4], (0, None))
+        self.assertEqual(applied[5], (-1, 1))
+        self.assertEqual(applied[8], (0, 3))
+
+
+class GameClockTests(SimpleTestCase):
+
+    def play(self, seed):
+        random.seed(seed)
+        game = Game(clock=TickClock())
+        for _ in range(20000):
+            step_all([game], game.clock)
+            if game.pause:
+                game.ball.reset(game.ball.x)
+                game.pause = False
+        return game.ball.x, game.ball.y, game.paddle1.score, game.paddle2.score
+
+    def test_tick_clock_is_deterministic(self):
+        self.assertEqual(self.play(3), self.play(3))
+
+    def test_friction_follows_game_clock(self):
+        clock = ManualClock()
+        game = Game(clock=clock)
+        game.ball.x_vel = game.ball.max_speed
+        game.ball.friction()
+        self.assertEqual(game.ball.x_vel, game.ball.max_speed)
+        clock.forward(1)
+        game.ball.friction()
+        self.assertLess(game.ball.x_vel, game.ball.max_speed)
+
+    def test_shared_clock_advances_once_per_tick(self):
+        clock = TickClock()
+        games = [Game(physics_rate=500, clock=clock) for _ in range(3)]
+        self.assertEqual(clock.tick_rate, 500)
+        for _ in range(250):
+            step_all(games, clock)
+        self.assertEqual(clock.now(), 0.5)
+        batch = BatchGame.from_games(games, clock=clock)
+        for _ in range(250):
+            batch.step()
+        self.assertEqual(clock.now(), 1.0)
+
+    def test_shared_clock_is_advanced_by_its_owner_only(self):
+        clock = TickClock()
+        owner, other = Game(clock=clock), Game(clock=clock)
+        owner.advance(0.01)
+        other.advance(0.01)
+        self.assertEqual((owner.tick, other.tick), (10, 10))
+        self.assertEqual(clock.ticks, 10)
+        BatchGame.from_games([owner, other], clock=clock)
+        owner.advance(0.01)
+        self.assertEqual(clock.ticks, 10)
+
+    def test_own_clock_advances_with_the_game(self):
+        game = Game(clock=TickClock())
+        game.advance(0.1)
+        self.assertEqual(game.clock.tick_rate, game.physics_rate)
+        self.assertAlmostEqual(game.clock.now(), game.tick / game.physics_rate)
+
+
+class SimulationTests(SimpleTestCase):
+
+    def test_match_is_reproducible(self):
+        first = simulate_match(predicting_controller, idle_controller, seed=2)
+        second = simulate_match(predicting_controller, idle_controller, seed=2)
+        self.assertEqual(first["winner"], "1")
+        self.assertEqual(first["rallies"], second["rallies"])
+        self.assertEqual(first["ticks"], second["ticks"])
+        self.assertEqual(len(first["rallies"]), first["score1"] + first["score2"])
+
+
+# decodeur binaire de l'IA, a cote du serveur dans le depot
+AI_DECODER = Path(__file__).resolve().parents[3] / "PongAI" / "binary_frame.py"
+
+
+class StateFrameTests(SimpleTestCase):
+
+    def test_encode_matches_json(self):
+        game = Game()
+        game.update_next_collision()
+        frame = game.frame()
+        frame.state["game_mode"] = "PVE"
+        for side in ("p1", "p2", None):
+            expected = dict(frame.state, side=side)
+            self.assertEqual(json.loads(frame.encode(side)), expected)
+
+    def test_binary_frame_layout(self):
+        game = Game()
+        game.update_next_collision()
+        frame = game.frame()
+        frame.state["game_mode"] = "PVE"
+        payload = frame.encode_binary("p2")
+        fields = struct.unpack("<BIffffffbfbfBBBBHHbbbbbH", payload)
+        self.assertEqual(fields[0], 3)
+        self.assertEqual(fields[1], game.tick)
+        self.assertAlmostEqual(fields[2], frame.state["ball"]["x"], places=5)
+        self.assertEqual(fields[15], 3)
+        self.assertTrue(fields[23] & (1 << 9))
+        self.assertFalse(fields[23] & (1 << 8))
+        self.assertFalse(fields[23] & (1 << 14))
+
+    @skipUnless(AI_DECODER.exists(), "PongAI is not next to the game server")
+    def test_ai_decoder_sees_the_json_ai_data(self):
+        spec = importlib.util.spec_from_file_location("ai_binary_frame", AI_DECODER)
+        decoder = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(decoder)
+        rng = random.Random(4)
+        for i in range(2000):
+            game = Game()
+            # positions sur les bords des cases de 75px, la ou les float32 changent de case
+            game.ball.x = rng.randint(0, 20) * 75 - (i % 3) * 1e-9
+            game.ball.y = rng.randint(0, 13) * 75 + (i % 3) * 1e-9
+            angle = rng.choice([rng.uniform(-math.pi, math.pi), rng.randint(-31, 31) / 10 + 0.05])
+            game.ball.x_vel = math.cos(angle)
+            game.ball.y_vel = math.sin(angle)
+            game.paddle2.y = rng.randint(0, 12) * 75 - game.paddle2.height / 2
+            game.update_next_collision()
+            frame = game.frame()
+            state = decoder.decode_state(frame.encode_binary("p2"))
+            self.assertEqual(state["game"]["ai_data"][:4], frame.state["game"]["ai_data"][:4])
+            self.assertEqual(state["ball"]["rounded_angle"], frame.state["ball"]["rounded_angle"])
+
+    def test_group_event_is_encoded_once_then_per_side(self):
+        game = Game()
+        game.update_next_collision()
+        frame = game.frame()
+        event = frame_event(frame, {"json", "binary"})
+        self.assertIsNone(event["keyframe"])
+        # seulement des types que le backend Redis sait serialiser
+        self.assertTrue(all(isinstance(value, (str, bytes, int, type(None))) for value in event.values()))
+
+        async def deliver():
+            layer = InMemoryChannelLayer()
+            await layer.group_add("pong_test", "client")
+            await layer.group_send("pong_test", event)
+            received = await layer.receive("client")
+
+            sent = []
+            consumer = PongConsumer()
+            consumer.side = "p1"
+
+            async def send(text_data=None, bytes_data=None):
+                sent.append(text_data if bytes_data is None else bytes_data)
+            consumer.send = send
+            await consumer.send_state_frame(received)
+            consumer.binary_frames = True
+            await consumer.send_state_frame(received)
+            return sent
+
+        sent = asyncio.run(deliver())
+        self.assertEqual(json.loads(sent[0]), dict(frame.state, side="p1"))
+        self.assertEqual(sent[1], frame.encode_binary("p1"))
+
+    def test_spectators_share_one_frame_at_reduced_rate(self):
+        game = Game()
+        game.update_next_collision()
+        frame = game.frame()
+        event = spectator_event(frame_event(frame, {"json", "binary"}))
+        self.assertEqual(json.loads(event["text"]), dict(frame.state, side="spectator"))
+        self.assertEqual(event["bytes"], frame.encode_binary("spectator"))
+
+        consumer = PongConsumer()
+        consumer.game_wrapper = GameWrapper("1abc")
+        consumer.game_wrapper.spectators["viewer"] = "json"
+        ticks = [x for x in range(6) if consumer.spectator_tick(x, {"goal": "None", "gameover": None})]
+        self.assertEqual(ticks, [0, 2, 4])
+        # un but est toujours transmis, meme hors cadence
+        self.assertTrue(consumer.spectator_tick(7, {"goal": "1", "gameover": None}))
+
+    def test_delta_frames_only_carry_changes(self):
+        game = Game()
+        game.update_next_collision()
+        encoder = DeltaEncoder(keyframe_interval=3)
+        keyframe = encoder.encode(game.frame())
+        self.assertEqual(keyframe.state["frame"], "key")
+
+        for _ in range(20):
+            game.step()
+        delta = encoder.encode(game.frame())
+        self.assertEqual(delta.state["frame"], "delta")
+        self.assertEqual(delta.state["key"], keyframe.state["key"])
+        self.assertIn("x", delta.state["changes"]["ball"])
+        self.assertNotIn("paddle1", delta.state["changes"])
+
+        game.goal1 = True
+        self.assertEqual(encoder.encode(game.frame()).state["frame"], "key")
+
+
+class InternalHttpClientTests(SimpleTestCase):
+
+    def test_retries_and_reuses_connection(self):
+        async def scenario():
+            calls = []
+
+            async def verify(request):
+                calls.append(request.transport.get_extra_info("peername"))
+                return web.Response(status=503 if len(calls) == 1 else 200, text="ok")
+
+            app = web.Application()
+            app.router.add_get("/game/verify/{uid}/", verify)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            client = InternalHttpClient(base_url=f"http://127.0.0.1:{port}", retry_delay=0)
+            try:
+                first = await client.request("GET", "verify", "/game/verify/abc/")
+                second = await client.request("GET", "verify", "/game/verify/abc/")
+            finally:
+                await client.close()
+                await runner.cleanup()
+            return calls, first, second
+
+        calls, first, second = asyncio.run(scenario())
+        self.assertEqual(first, (200, "ok"))
+        self.assertEqual(second, (200, "ok"))
+        # 503 rejoue, puis toutes les requetes passent par la meme connexion
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(set(calls)), 1)
+
+    def test_session_of_a_previous_loop_is_closed(self):
+        client = InternalHttpClient(base_url="http://127.0.0.1:1")
+
+        async def open_session():
+            return await client.session()
+
+        first = asyncio.run(open_session())
+        second = asyncio.run(open_session())
+        try:
+            self.assertTrue(first.closed)
+            self.assertIsNot(first, second)
+            self.assertFalse(second.closed)
+        finally:
+            asyncio.run(client.close())
+
+    def test_lifespan_closes_the_shared_client(self):
+        async def scenario():
+            session = await internal_http.session()
+            messages = asyncio.Queue()
+            sent = []
+            for message in ("lifespan.startup", "lifespan.shutdown"):
+                messages.put_nowait({"type": message})
+
+            async def send(message):
+                sent.append(message["type"])
+
+            await lifespan({"type": "lifespan"}, messages.get, send)
+            return session, sent
+
+        session, sent = asyncio.run(scenario())
+        self.assertTrue(session.closed)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+class GameTicketTests(SimpleTestCase):
+
+    def test_ticket_binds_uid_token_and_expiry(self):
+        ticket = issue_ticket("secret", "PVPabc", "Bearer token", now=1000)
+        self.assertTrue(verify_ticket("secret", ticket, "PVPabc", "token", now=1100))
+        self.assertFalse(verify_ticket("secret", ticket, "PVPabd", "token", now=1100))
+        self.assertFalse(verify_ticket("secret", ticket, "PVPabc", "other", now=1100))
+        self.assertFalse(verify_ticket("secret", ticket, "PVPabc", "token", now=1200))
+        self.assertFalse(verify_ticket("other", ticket, "PVPabc", "token", now=1100))
+        self.assertFalse(verify_ticket("secret", "x" + ticket, "PVPabc", "token", now=1100))
+        self.assertFalse(verify_ticket("secret", "garbage", "PVPabc", "token", now=1100))
+
+
+class JwtCacheTests(SimpleTestCase):
+
+    def test_lru_with_expiry(self):
+        cache = JwtCache(max_size=2)
+        cache.put("a", {"username": "a", "exp": 200}, now=100)
+        cache.put("b", {"username": "b"}, now=100)
+        self.assertEqual(cache.get("a", now=150), {"username": "a", "exp": 200})
+        # "b" est le moins recemment utilise
+        cache.put("c", {"username": "c", "exp": 500}, now=150)
+        self.assertIsNone(cache.get("b", now=150))
+        self.assertIsNone(cache.get("a", now=200))
+        self.assertIsNotNone(cache.get("c", now=200))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 2, "misses": 2})
+
+    def test_stats_are_logged_every_n_lookups(self):
+        cache = JwtCache(log_every=3)
+        cache.put("a", {"username": "a"}, now=100)
+        with self.assertLogs(level="INFO") as logs:
+            for _ in range(6):
+                cache.get("a", now=150)
+            cache.get("b", now=150)
+        self.assertEqual(logs.output, [
+            "INFO:root:jwt cache stats: {'size': 1, 'hits': 3, 'misses': 0}",
+            "INFO:root:jwt cache stats: {'size': 1, 'hits': 6, 'misses': 0}",
+        ])
+
+
+class GameShardTests(SimpleTestCase):
+
+    def test_shard_keeps_mode_characters(self):
+        for uid in ["1eaaa342-9c1e-42c9-8591-22d82be7501c2", "PVP1fdc39f9-3b2a-4039-9273-0a0789f2e8c0",
+                    "k4a06209-77ac-4fdd-ba9f-7f0cae0a744k"]:
+            sharded = with_shard(uid, 10)
+            self.assertEqual(shard_of(sharded), 10)
+            self.assertEqual((sharded[0], sharded[-1], len(sharded)), (uid[0], uid[-1], len(uid)))
+        self.assertIsNone(shard_of("PVPnotauid"))
+        self.assertIsNone(shard_of("1eaaa342-zzzz-42c9-8591-22d82be7501c2"))
+
+
+class SendQueueTests(SimpleTestCase):
+
+    def test_slow_client_keeps_control_and_newest_frames(self):
+        queue = SendQueue(max_frames=2)
+        # "None:None" : premiere frame de l'etat, gardee ; les suivantes sont jetables
+        for tick in range(5):
+            queue.push_frame({"tick": tick, "marker": "None:None"})
+        queue.push_message("names")
+        queue.push_frame({"tick": 5, "marker": "1:None"})
+        for tick in range(6, 10):
+            queue.push_frame({"tick": tick, "marker": "1:None"})
+
+        async def drain():
+            sent = []
+
+            async def send(kind, payload):
+                sent.append(payload if kind == "message" else payload["tick"])
+                if not queue.entries:
+                    queue.close()
+            await queue.run(send)
+            return sent
+
+        self.assertEqual(asyncio.run(drain()), [0, "names", 5, 8, 9])
+        self.assertEqual(queue.stats()["dropped"], 6)
+        self.assertEqual(queue.stats()["sent"], 5)
+
+
+class GameSnapshotTests(SimpleTestCase):
+
+    def playing_wrapper(self):
+        wrapper = GameWrapper("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+        wrapper.game.update_next_collision()
+        wrapper.player_1.name = "alice"
+        wrapper.player_1.token_digest = "digest"
+        wrapper.player_2.push_input(1, sequence=7)
+        for _ in range(300):
+            wrapper.game.step()
+        wrapper.game.paddle2.score = 2
+        wrapper.start_event.set()
+        wrapper.main_side = "p2"
+        return wrapper
+
+    def test_snapshot_round_trip(self):
+        wrapper = self.playing_wrapper()
+        payload = encode_snapshot(snapshot_game(wrapper))
+        self.assertLess(len(payload), 1024)
+
+        restored = restore_game(decode_snapshot(payload), "PVP1fdc39f9-0001-4039-9273-0a0789f2e8c0")
+        game, original = restored.game, wrapper.game
+        self.assertTrue(restored.restored)
+        self.assertEqual(restored.game_id, "PVP1fdc39f9-0001-4039-9273-0a0789f2e8c0")
+        self.assertEqual((game.tick, game.paddle2.score, game.paddle2.y, game.paddle2.action),
+                         (original.tick, 2, original.paddle2.y, 1))
+        self.assertEqual((game.ball.x, game.ball.y, game.ball.x_vel, game.ball.y_vel),
+                         (original.ball.x, original.ball.y, original.ball.x_vel, original.ball.y_vel))
+        self.assertEqual(game.nextCollision, original.nextCollision)
+        self.assertEqual(game.paddle2.inputs.last_sequence, 7)
+        self.assertEqual((restored.player_1.name, restored.player_1.token_digest), ("alice", "digest"))
+        self.assertFalse(restored.player_1.is_connected)
+        self.assertTrue(restored.start_event.is_set())
+        self.assertEqual(restored.main_side, "p2")
+
+    async def fake_matchmaking(self, games):
+        # matchmaking reduit a ses parties : renommage et nettoyage par uid
+        async def rename(request):
+            game = games.pop(request.match_info["uid"], None)
+            if game is None:
+                return web.json_response({"status": "game not found"}, status=404)
+            games[(await request.json())["uid"]] = game
+            return web.json_response({"status": "success"})
+
+        async def cleanup(request):
+            found = games.pop(request.match_info["uid"], None) is not None
+            return web.json_response({}, status=200 if found else 404)
+
+        app = web.Application()
+        app.router.add_post("/game/rename/{uid}/", rename)
+        app.router.add_delete("/game/cleanup/{uid}/", cleanup)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, InternalHttpClient(base_url=f"http://127.0.0.1:{port}", retry_delay=0)
+
+    def test_migration_through_channel_layer(self):
+        async def migrate():
+            layer = InMemoryChannelLayer()
+            source, target = GameManager(), GameManager()
+            target.shard_id = 1
+            wrapper = self.playing_wrapper()
+            source.active_games[wrapper.game_id] = wrapper
+            await layer.group_add(f"pong_{wrapper.game_id}", "client")
+            games = {wrapper.game_id: {"shard": 0}}
+            runner, source.http = await self.fake_matchmaking(games)
+
+            try:
+                new_id = await source.migrate_game(wrapper.game_id, 1, layer)
+                redirect = await layer.receive("client")
+                imported = await target.receive_migrated_game(new_id, layer)
+                renamed = dict(games)
+                # fin de partie sur le nouveau shard : le nettoyage trouve la partie sous son nouvel uid
+                cleanup = await source.http.request("DELETE", "cleanup", f"/game/cleanup/{new_id}/")
+            finally:
+                await source.http.close()
+                await runner.cleanup()
+            return new_id, redirect, imported, source, renamed, cleanup[0], games
+
+        new_id, redirect, imported, source, renamed, cleanup, games = asyncio.run(migrate())
+        self.assertEqual(new_id, "PVP1fdc39f9-0001-4039-9273-0a0789f2e8c0")
+        self.assertEqual(redirect, {"type": "game.redirect", "uid": new_id})
+        self.assertEqual(imported.game.paddle2.score, 2)
+        self.assertEqual(source.active_games, {})
+        self.assertEqual(list(renamed), [new_id])
+        self.assertEqual(cleanup, 200)
+        self.assertEqual(games, {})
+
+    def test_waiting_for_a_snapshot_does_not_block_the_shard(self):
+        async def wait():
+            layer = InMemoryChannelLayer()
+            manager = GameManager()
+            pending = asyncio.ensure_future(manager.receive_migrated_game("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0", layer, timeout=0.5))
+            await asyncio.sleep(0.01)
+            started = time.monotonic()
+            await manager.create_or_get_game("PVP2fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            blocked = time.monotonic() - started
+            return blocked, await pending
+
+        blocked, missing = asyncio.run(wait())
+        self.assertLess(blocked, 0.1)
+        self.assertIsNone(missing)
+
+
+class ReconnectTests(SimpleTestCase):
+
+    def player_consumer(self, layer, wrapper, channel_name, token):
+        consumer = PongConsumer()
+        consumer.channel_layer = layer
+        consumer.channel_name = channel_name
+        consumer.game_wrapper = wrapper
+        consumer.game_id = wrapper.game_id
+        consumer.group_name = f"pong_{wrapper.game_id}"
+        consumer.jwt_token = token
+        consumer.connect_started = time.monotonic()
+        return consumer
+
+    def test_dropped_player_resumes_its_side(self):
+        async def blip():
+            layer = InMemoryChannelLayer()
+            wrapper = GameWrapper("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            wrapper.start_event.set()
+            wrapper.present_players = 2
+            for player, token in ((wrapper.player_1, "tok1"), (wrapper.player_2, "tok2")):
+                player.is_connected = True
+                player.token_digest = token_digest(token)
+            wrapper.player_1.push_input(1, sequence=40)
+
+            dropped = self.player_consumer(layer, wrapper, "dropped", "tok1")
+            dropped.mode, dropped.side = "PVP_LAN", "p1"
+            await layer.group_add(dropped.group_name, "other")
+            await dropped.disconnect(1006)
+            notice = await layer.receive("other")
+            suspended = (wrapper.suspended, wrapper.present_players, wrapper.player_1.is_connected)
+
+            back = self.player_consumer(layer, wrapper, "back", "tok1")
+            back.resuming = True
+            intruder = self.player_consumer(layer, wrapper, "intruder", "tok3")
+            can_resume = (back._can_resume(), intruder._can_resume())
+            back._init_resumed_side()
+            # le delai de grace expire sans effet : le joueur est revenu
+            await asyncio.sleep(0.05)
+            return notice, suspended, can_resume, back
+
+        grace = consumers.RECONNECT_GRACE
+        consumers.RECONNECT_GRACE = 0.01
+        try:
+            notice, suspended, can_resume, back = asyncio.run(blip())
+        finally:
+            consumers.RECONNECT_GRACE = grace
+
+        wrapper = back.game_wrapper
+        self.assertEqual(json.loads(notice["text"]), {"type": "opponent_disconnected", "grace": 0.01})
+        self.assertEqual(suspended, (True, 1, False))
+        self.assertEqual(can_resume, (True, False))
+        self.assertEqual((back.side, back.is_main), ("p1", True))
+        self.assertTrue(wrapper.resumed.is_set())
+        self.assertFalse(wrapper.game_over.is_set())
+        self.assertEqual(wrapper.present_players, 2)
+        # nouvelle connexion, nouvelle sequence d'entrees
+        self.assertTrue(wrapper.player_1.push_input(-1, sequence=0))
+
+    def test_suspended_game_recognises_its_player_without_resume_flag(self):
+        async def blip():
+            layer = InMemoryChannelLayer()
+            wrapper = GameWrapper("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            wrapper.start_event.set()
+            wrapper.present_players = 2
+            for player, token in ((wrapper.player_1, "tok1"), (wrapper.player_2, "tok2")):
+                player.is_connected = True
+                player.token_digest = token_digest(token)
+            game_manager.active_games[wrapper.game_id] = wrapper
+            try:
+                dropped = self.player_consumer(layer, wrapper, "dropped", "tok1")
+                dropped.mode, dropped.side = "PVP_LAN", "p1"
+                await dropped.disconnect(1006)
+
+                # le proxy a perdu ?resume=1 : seul le token designe le joueur
+                intruder = self.player_consumer(layer, wrapper, "intruder", "tok3")
+                intruder.game_wrapper = None
+                back = self.player_consumer(layer, wrapper, "back", "tok1")
+                back.game_wrapper = None
+                found = (intruder._resume_from_token(), intruder.resuming, intruder.game_wrapper)
+                resumed = (back._resume_from_token(), back.resuming)
+                back._init_resumed_side()
+                await asyncio.sleep(0.05)
+                return found, resumed, back
+            finally:
+                game_manager.active_games.pop(wrapper.game_id, None)
+
+        grace = consumers.RECONNECT_GRACE
+        consumers.RECONNECT_GRACE = 0.01
+        try:
+            found, resumed, back = asyncio.run(blip())
+        finally:
+            consumers.RECONNECT_GRACE = grace
+
+        self.assertEqual(found, (False, False, None))
+        self.assertEqual(resumed, (True, True))
+        self.assertEqual((back.side, back.is_main), ("p1", True))
+        self.assertEqual(back.game_wrapper.present_players, 2)
+        self.assertFalse(back.game_wrapper.game_over.is_set())
+
+
+class GameReaperTests(SimpleTestCase):
+
+    def test_expires_games_by_status_and_age(self):
+        async def sweep():
+            layer = InMemoryChannelLayer()
+            manager = GameManager()
+            waiting = await manager.create_or_get_game("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            waiting.connections["client"] = "json"
+            await layer.group_add(f"pong_{waiting.game_id}", "client")
+            paused = await manager.create_or_get_game("PVP2fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            paused.set_status(GameStatus.PAUSED)
+            orphan = await manager.create_or_get_game("PVP3fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            orphan.set_status(GameStatus.IN_PROGRESS)
+            orphan.connections["gone"] = "json"
+            stats = manager.reaper_stats()
+
+            start = time.monotonic()
+            first = await manager.reap(layer, now=start + 10)
+            del orphan.connections["gone"]
+            second = await manager.reap(layer, now=start + 20)
+            third = await manager.reap(layer, now=start + 61)
+            fourth = await manager.reap(layer, now=start + 121)
+            notice = await layer.receive("client")
+            return manager, stats, (first, second, third, fourth), notice, orphan
+
+        manager, stats, sweeps, notice, orphan = asyncio.run(sweep())
+        self.assertEqual(stats["active"], 3)
+        self.assertGreater(stats["avg_bytes_per_game"], 0)
+        self.assertEqual(sweeps, ([], [], ["PVP2fdc39f9-0000-4039-9273-0a0789f2e8c0", "PVP3fdc39f9-0000-4039-9273-0a0789f2e8c0"],
+                                  ["PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0"]))
+        self.assertEqual(notice, {"type": "game.expired"})
+        self.assertEqual(manager.active_games, {})
+        self.assertEqual(manager.reaper_stats()["reaped_by_status"], {"paused": 1, "in_progress": 1, "waiting": 1})
+        self.assertEqual(orphan.status, GameStatus.CANCELLED)
+        self.assertTrue(orphan.game_over.is_set())
+
+    def test_stats_are_logged(self):
+        async def run():
+            manager = GameManager()
+            await manager.create_or_get_game("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            with self.assertLogs(level="INFO") as logs:
+                manager.log_stats()
+            return manager.stats(), logs.output
+
+        stats, output = asyncio.run(run())
+        self.assertEqual(stats["reaper"]["active"], 1)
+        self.assertIn("leaked", stats["tasks"])
+        self.assertEqual(stats["lobby"]["games"], 0)
+        self.assertIn("game server stats: {'reaper': {'active': 1", output[0])
+
+
+class GameTasksTests(SimpleTestCase):
+
+    def test_tasks_are_cancelled_by_owner_then_with_the_game(self):
+        async def stubborn():
+            # avale l'annulation et continue un moment : doit etre signalee comme fuite
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                pass
+            await asyncio.sleep(0.1)
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def run():
+            tasks = GameTasks("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            writer = tasks.spawn(asyncio.sleep(60), "writer", owner="client")
+            loop = tasks.spawn(asyncio.sleep(60), "generate_states")
+            tasks.spawn(fail(), "fail")
+            stuck = tasks.spawn(stubborn(), "stubborn")
+            await asyncio.sleep(0)
+            tasks.cancel("client")
+            await asyncio.sleep(0)
+            after_disconnect = (writer.cancelled(), loop.done())
+            tasks.close()
+            late = tasks.spawn(asyncio.sleep(60), "late")
+            await asyncio.sleep(0.05)
+            stats = tasks.stats()
+            await stuck
+            return after_disconnect, loop.cancelled(), late, stats
+
+        delay = game_tasks.LEAK_CHECK_DELAY
+        game_tasks.LEAK_CHECK_DELAY = 0.01
+        try:
+            after_disconnect, loop_cancelled, late, stats = asyncio.run(run())
+        finally:
+            game_tasks.LEAK_CHECK_DELAY = delay
+
+        self.assertEqual(after_disconnect, (True, False))
+        self.assertTrue(loop_cancelled)
+        self.assertIsNone(late)
+        self.assertEqual(stats, {"running": 1, "spawned": 4, "cancelled": 2, "failed": 1, "leaked": 2})
+
+
+class LobbyTests(SimpleTestCase):
+
+    def test_first_frame_follows_the_countdown(self):
+        async def start():
+            layer = InMemoryChannelLayer()
+            wrapper = GameWrapper("PVP1fdc39f9-0000-4039-9273-0a0789f2e8c0")
+            wrapper.game.update_next_collision()
+            wrapper.connections["p1"] = "json"
+            await layer.group_add(f"pong_{wrapper.game_id}", "p1")
+            consumer = PongConsumer()
+            consumer.channel_layer = layer
+            consumer.channel_name = "p2"
+            consumer.game_wrapper = wrapper
+            consumer.game_id = wrapper.game_id
+            consumer.group_name = f"pong_{wrapper.game_id}"
+            consumer.mode, consumer.side = "PVP_LAN", "p2"
+            consumer.connect_started = time.monotonic()
+
+            for event in (wrapper.ai_is_initialized, wrapper.received_names, wrapper.start_event):
+                event.set()
+            loop = asyncio.ensure_future(consumer.generate_states())
+            countdown = await layer.receive("p1")
+            frame = await layer.receive("p1")
+            loop.cancel()
+            await asyncio.gather(loop, return_exceptions=True)
+            return wrapper.lobby, json.loads(countdown["text"]), frame
+
+        ticks = consumers.LOBBY_COUNTDOWN_TICKS
+        consumers.LOBBY_COUNTDOWN_TICKS = 6
+        try:
+            lobby, countdown, frame = asyncio.run(start())
+        finally:
+            consumers.LOBBY_COUNTDOWN_TICKS = ticks
+
+        self.assertEqual(countdown, {"type": "countdown", "ticks": 6, "seconds": 0.1})
+        self.assertEqual(frame["type"], "state.frame")
+        self.assertEqual(lobby.state, LobbyState.PLAYING)
+        self.assertEqual(list(lobby.timings()), ["connected", "named", "ready", "countdown", "playing"])
+        self.assertGreaterEqual(lobby.start_latency(), 0.09)
+        self.assertLess(lobby.start_latency(), 0.5)
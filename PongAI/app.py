@@ -8,6 +8,7 @@ import requests
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 import threading
 from pong_ql import QL_AI
+from binary_frame import BINARY_SUBPROTOCOL, DIRECTIONS, decode_state, encode_input
 import random
 import os
 
@@ -155,7 +156,7 @@ class AIService:
         difficulty = self._get_difficulty_from_uid(uid)
 #         # logging.info(f"Adding game instance for {uid} with difficulty {difficulty}")
         global_ai = self.global_models[difficulty]
-        self.game_instances[uid] = {'ai': GameAgent(global_ai)}
+        self.game_instances[uid] = {'ai': GameAgent(global_ai), 'input_sequence': 0}
 
     def _get_difficulty_from_uid(self, uid: str) -> str:
         if uid[0] == '1':
@@ -179,11 +180,10 @@ class AIService:
 #                     logging.info(f"Waiting for action for game {uid}\n\n\n")
                     return
 
-                await websocket.send(json.dumps({
-                    "type": "move",
-                    "direction": str(action),
-                    'sender': 'AI'
-                }))
+                # entree binaire de 4 octets a la place du message JSON "move"
+                instance = self.game_instances[uid]
+                await websocket.send(encode_input(DIRECTIONS.get(action, 0), instance['input_sequence']))
+                instance['input_sequence'] += 1
         except Exception as e:
             logging.error(f"Error processing action for game {uid}: {e}")
             await self.cleanup_ai_instance(uid)
@@ -193,28 +193,46 @@ class AIService:
             del self.game_instances[uid]
 #             logging.info(f"Cleaned up AI instance for game {uid}")
 
-    async def listen_for_messages(self, websocket, game_uid):
+    async def listen_for_messages(self, websocket, game_uid, resume=False):
         try:
             while True:
                 try:
                     message = await websocket.recv()
-                    event = json.loads(message)
+                    event = decode_state(message) if isinstance(message, bytes) else json.loads(message)
                     if event["type"] == "None":
                         await self.process_and_send_action(websocket, event, game_uid)
                     elif event["type"] == "gameover":
 #                         # logging.info(f"AI: Game over for game {game_uid}")
                         await self.cleanup_ai_instance(game_uid)
                         return
+                    elif event["type"] == "redirect":
+                        # partie deplacee sur un autre serveur de jeu : l'IA la suit sous son nouvel uid
+                        if game_uid in self.game_instances:
+                            self.game_instances[event["uid"]] = self.game_instances.pop(game_uid)
+                            asyncio.create_task(self.join_game(event["uid"], event.get("ticket"), resume=True))
+                        return
                     await asyncio.sleep(0.001)
                 except asyncio.TimeoutError:
                     continue
         except websockets.exceptions.ConnectionClosedError:
             # print(f"Connection closed for game {game_uid}")
+            if not resume and game_uid in self.game_instances:
+                # coupure : la partie attend l'IA quelques secondes, une seule tentative de reprise
+                asyncio.create_task(self.join_game(game_uid, resume=True))
+                return
             await self.cleanup_ai_instance(game_uid)
             return
 
-    async def join_game(self, uid: str):
+    async def join_game(self, uid: str, ticket: str = None, resume: bool = False):
         uri = f"wss://nginx:7777/ws/pong/{uid}/"
+        params = []
+        if ticket:
+            # ticket signe par le matchmaking, evite au serveur de jeu de le rappeler
+            params.append(f"ticket={ticket}")
+        if resume:
+            params.append("resume=1")
+        if params:
+            uri += "?" + "&".join(params)
         ssl_context = ssl.create_default_context()
         ssl_context.check_hostname = False
         ssl_context.verify_mode = ssl.CERT_NONE
@@ -227,7 +245,7 @@ class AIService:
             async with websockets.connect(
                     uri,
                     ssl=ssl_context,
-                    subprotocols=[f'token_{ai_token}']  # Ajouter le token comme sous-protocole
+                    subprotocols=[f'token_{ai_token}', BINARY_SUBPROTOCOL]  # token puis etats binaires
             ) as websocket:
                 # print(f"IA connectée à la partie {uid}")
                 await websocket.send(json.dumps({
@@ -235,7 +253,7 @@ class AIService:
                     "sender": "AI",
                     "name": "AI"
                 }))
-                await self.listen_for_messages(websocket, uid)
+                await self.listen_for_messages(websocket, uid, resume)
         # except websockets.exceptions.InvalidStatusCode as e:
         #     logging.error(f"Auth error in join_game for {uid}: {e}")
         #     await self.cleanup_ai_instance(uid)
@@ -258,7 +276,7 @@ class AIService:
                         uid = data['uid']
                         if uid not in self.game_instances:
                             self.add_game_instance(uid)
-                            asyncio.create_task(self.join_game(uid))
+                            asyncio.create_task(self.join_game(uid, data.get('ticket')))
 #                             # logging.info(f"Joining new game: {uid}")
             except Exception as e:
                 logging.error(f"Error in continuous_listen_for_uid: {e}")
@@ -7,6 +7,8 @@ import base64
 import json
 from urllib.parse import urlparse, parse_qs
 
+from .jwt_cache import jwt_cache
+
 answers = {
     "invalid": {"error": "Invalid request", "status": 400},
     "unauthorized": {"error": "Authentication required", "status": 401},
@@ -194,6 +196,10 @@ class Request_Authenticator:
             # Extraire le token JWT a partir du premier = (pour les cookies)
             jwt_token = token.split('=')[-1]
 
+            # token deja verifie et pas encore expire : pas de nouveau decodage
+            if jwt_cache.get(jwt_token) is not None:
+                return True
+
             # 1. Décodage non sécurisé (base64)
             unsafe_payload = Request_Authenticator.decode_jwt_unsafe(jwt_token)
             if not unsafe_payload:
@@ -222,6 +228,7 @@ class Request_Authenticator:
                 return False
             # logging.info(f"JWT validé pour: {secure_payload.get('username')}")
             # return secure_payload
+            jwt_cache.put(jwt_token, secure_payload)
             return True
 
         except InvalidTokenError as e:
@@ -3,6 +3,9 @@ import uuid
 import logging
 import os
 
+from .game_ticket import issue_ticket
+from .game_shard import shard_count, with_shard
+
 
 class GameStatus:
     WAITING_AI = "waiting_ai"
@@ -14,16 +17,20 @@ class GameSession:
     def __init__(self):
         self.active_games = {}
         self.AI_token = os.getenv("AI_SERVICE_TOKEN")
+        self.ticket_secret = os.getenv("GAME_TICKET_SECRET")
+        self.shard_count = shard_count()
 
     def create_game(self, mode: str, option: str = None, jwt: str = None) -> str:
         """Crée une nouvelle partie"""
         self.cleanup_finished_games()  # Nettoyer les anciennes parties
 
         #logging.info(f"Creating game with mode: {mode}, option: {option}")
-        uid = self._generate_uid(mode, option)
+        shard = self._pick_shard()
+        uid = self._generate_uid(mode, option, shard)
         status = self._determine_initial_status(mode, option)
 
         self.active_games[uid] = self.initialize_game(mode, option, status, jwt)
+        self.active_games[uid]['shard'] = shard
 
         # self.active_games[uid] = {
         #     'mode': mode,
@@ -70,17 +77,25 @@ class GameSession:
             return GameStatus.WAITING_PLAYER
         return GameStatus.READY
 
-    def _generate_uid(self, mode: str, option: str) -> str:
+    def _pick_shard(self) -> int:
+        """Shard du serveur de jeu qui a le moins de parties en cours"""
+        load = [0] * self.shard_count
+        for game in self.active_games.values():
+            if game.get('shard', 0) < self.shard_count:
+                load[game.get('shard', 0)] += 1
+        return load.index(min(load))
+
+    def _generate_uid(self, mode: str, option: str, shard: int = 0) -> str:
         """Génère un UID unique selon le mode"""
         if mode == 'PVE':
-            return self._generate_pve_uid(option)
+            return self._generate_pve_uid(option, shard)
         elif mode == 'PVP':
-            return self._generate_pvp_uid(option)
+            return self._generate_pvp_uid(option, shard)
         raise ValueError(f"Mode non reconnu: {mode}")
 
-    def _generate_pve_uid(self, difficulty: str) -> str:
+    def _generate_pve_uid(self, difficulty: str, shard: int = 0) -> str:
         """Génère un UID pour une partie PVE"""
-        uid = str(uuid.uuid4())
+        uid = with_shard(str(uuid.uuid4()), shard)
         uid = difficulty[0] + uid[1:]
         if len(difficulty) == 1:
             uid += '2'
@@ -89,7 +104,7 @@ class GameSession:
             uid += '1'
 
         while uid in self.active_games:
-            uid = str(uuid.uuid4())
+            uid = with_shard(str(uuid.uuid4()), shard)
             uid = difficulty[0] + uid[1:]
             if len(difficulty) == 1:
                 uid += '2'
@@ -97,17 +112,17 @@ class GameSession:
                 uid += '1'
         return uid
 
-    def _generate_pvp_uid(self, option: str) -> str:
+    def _generate_pvp_uid(self, option: str, shard: int = 0) -> str:
         """Génère un UID pour une partie PVP"""
         if option == '1':  # LAN
-            uid = "PVP" + str(uuid.uuid4())
+            uid = "PVP" + with_shard(str(uuid.uuid4()), shard)
             while uid in self.active_games:
-                uid = "PVP" + str(uuid.uuid4())
+                uid = "PVP" + with_shard(str(uuid.uuid4()), shard)
             return uid
         else:  # Keyboard
-            uid = 'k' + str(uuid.uuid4())[1:-1] + 'k'
+            uid = 'k' + with_shard(str(uuid.uuid4()), shard)[1:-1] + 'k'
             while uid in self.active_games:
-                uid = 'k' + str(uuid.uuid4())[1:-1] + 'k'
+                uid = 'k' + with_shard(str(uuid.uuid4()), shard)[1:-1] + 'k'
             return uid
 
     def _find_waiting_ai_game(self) -> str:
@@ -130,6 +145,13 @@ class GameSession:
         return 'error'
 
 
+    def issue_ticket(self, uid: str, jwt: str):
+        """Ticket signe que le serveur de jeu verifie sans rappeler le matchmaking"""
+        if not self.ticket_secret or not jwt or uid == 'error':
+            return None
+        return issue_ticket(self.ticket_secret, uid, jwt)
+
+
     def remove_game(self, uid: str) -> bool:
         """Supprime une partie terminée"""
         try:
@@ -144,6 +166,16 @@ class GameSession:
             return False
         
 
+    def rename_game(self, uid: str, new_uid: str, shard: int) -> bool:
+        """Partie deplacee sur un autre shard par le serveur de jeu : elle garde ses joueurs sous son nouvel uid"""
+        game = self.active_games.pop(uid, None)
+        if game is None:
+            logging.warning(f"Game {uid} not found for rename")
+            return False
+        game['shard'] = shard
+        self.active_games[new_uid] = game
+        return True
+
     def cleanup_finished_games(self):
         """Nettoie les parties terminées"""
         current_time = datetime.now()
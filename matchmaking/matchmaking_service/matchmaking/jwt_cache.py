@@ -0,0 +1,65 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+
+# Cache LRU des JWT deja verifies : un client (IA, CLI) qui renvoie le meme token
+# ne repaye pas le decodage et la verification de signature. Les entrees sont
+# indexees par l'empreinte du token et expirent a la date "exp" du JWT.
+# Meme fichier dans GameServer/PongGame/pong/.
+class JwtCache:
+
+    def __init__(self, max_size=1024, default_ttl=300, log_every=1000):
+        self.max_size = max_size
+        # duree de vie des tokens sans claim "exp"
+        self.default_ttl = default_ttl
+        # les stats sont ecrites dans les logs toutes les log_every recherches
+        self.log_every = log_every
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str, now=None):
+        now = time.time() if now is None else now
+        key = self.key(token)
+        entry = self.entries.get(key)
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            self.log_stats()
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.log_stats()
+        return entry[0]
+
+    def log_stats(self):
+        if self.log_every and (self.hits + self.misses) % self.log_every == 0:
+            logging.info(f"jwt cache stats: {self.stats()}")
+
+    def put(self, token: str, payload: dict, now=None):
+        now = time.time() if now is None else now
+        expires_at = payload.get('exp', now + self.default_ttl)
+        if expires_at <= now:
+            return
+        key = self.key(token)
+        self.entries[key] = (payload, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Instance unique
+jwt_cache = JwtCache()
@@ -1,3 +1,27 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .jwt_cache import JwtCache
+
+
+class JwtCacheTests(SimpleTestCase):
+
+    def test_lru_with_expiry(self):
+        cache = JwtCache(max_size=2)
+        cache.put("a", {"username": "a", "exp": 200}, now=100)
+        cache.put("b", {"username": "b"}, now=100)
+        self.assertEqual(cache.get("a", now=150), {"username": "a", "exp": 200})
+        # "b" est le moins recemment utilise
+        cache.put("c", {"username": "c", "exp": 500}, now=150)
+        self.assertIsNone(cache.get("b", now=150))
+        self.assertIsNone(cache.get("a", now=200))
+        self.assertIsNotNone(cache.get("c", now=200))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 2, "misses": 2})
+
+    def test_stats_are_logged_every_n_lookups(self):
+        cache = JwtCache(log_every=2)
+        cache.put("a", {"username": "a"}, now=100)
+        with self.assertLogs(level="INFO") as logs:
+            cache.get("a", now=150)
+            cache.get("b", now=150)
+            cache.get("a", now=150)
+        self.assertEqual(logs.output, ["INFO:root:jwt cache stats: {'size': 1, 'hits': 1, 'misses': 1}"])
@@ -16,6 +16,7 @@ import websockets
 from matchmaking.game_session import game_session
 from rest_framework.decorators import api_view
 from .Tournament import get_tournament
+from .game_shard import shard_of
 
 # views.py
 @api_view(['GET'])
@@ -42,7 +43,7 @@ def create_game(request):
         #############################################################
 
         uid = game_session.create_game(mode, option, jwt)
-        return JsonResponse({'uid': uid}, status=200)
+        return JsonResponse({'uid': uid, 'ticket': game_session.issue_ticket(uid, jwt)}, status=200)
     # except InvalidTokenError as e:
     #     return JsonResponse({'error': str(e)}, status=401)
     except Exception as e:
@@ -64,11 +65,12 @@ def join_game(request):
 
         mode = request.GET.get('mode')
         option = request.GET.get('option')
+        jwt = request.headers.get('Authorization')
 
-        uid = game_session.find_available_game(mode, option)
+        uid = game_session.find_available_game(mode, option, jwt)
         if uid == 'error':
             return JsonResponse({'uid': 'error'}, status=404)
-        return JsonResponse({'uid': uid}, status=200)
+        return JsonResponse({'uid': uid, 'ticket': game_session.issue_ticket(uid, jwt)}, status=200)
 
     except Exception as e:
         logging.error(f"Error in join_game: {e}")
@@ -96,6 +98,26 @@ def cleanup_game(request, uid):
         logging.error(f"Error in cleanup_game: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@api_view(['POST'])
+def rename_game(request, uid):
+    """View appelee par le serveur de jeu quand une partie change de shard"""
+    try:
+        parse_result = Request_Authenticator.parse_cleanup_request(request)
+        if parse_result is not None:
+            return JsonResponse(parse_result, status=parse_result["status"])
+        authenticate_result = Request_Authenticator.authenticate_cleanup_request(request)
+        if authenticate_result is not None:
+            return JsonResponse(authenticate_result, status=authenticate_result["status"])
+        new_uid = request.data.get('uid')
+        if not new_uid:
+            return JsonResponse({'error': 'Invalid request'}, status=400)
+        if game_session.rename_game(uid, new_uid, shard_of(new_uid) or 0):
+            return JsonResponse({'status': 'success'}, status=200)
+        return JsonResponse({'status': 'game not found'}, status=404)
+    except Exception as e:
+        logging.error(f"Error in rename_game: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 def does_game_exist(request, uid):
     """View pour vérifier si une partie existe"""
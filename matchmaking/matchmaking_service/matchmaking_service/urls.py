@@ -37,5 +37,8 @@ urlpatterns = [
     re_path(r'^game/cleanup/([a-zA-Z0-9-]+)/$',
             views.cleanup_game,
             name='cleanup_game'),
+    re_path(r'^game/rename/([a-zA-Z0-9-]+)/$',
+            views.rename_game,
+            name='rename_game'),  # Partie deplacee sur un autre shard
     re_path(r'game/verify/([a-zA-Z0-9-]+)/$', views.does_game_exist, name='does_game_exist'),
 ]